@@ -0,0 +1,206 @@
+"""
+Load harness for the bot's update handlers.
+
+Builds the production dispatcher (lib.bot.main.create_dispatcher, all
+routers and middlewares) and feeds it synthetic /start, /digest, /settings
+and settings-callback updates through Dispatcher.feed_update. Bot API calls
+are answered by an in-process fake session and Celery tasks go to an
+in-memory broker, so only Postgres and Redis are real; use scratch ones.
+
+Two phases are reported:
+- cost: a few updates of each kind one at a time, with the SQL statements
+  and Bot API calls they cost, to catch extra round-trips;
+- load: `--updates` updates of a weighted mix from `--concurrency`
+  concurrent senders, with throughput and latency percentiles per kind.
+
+Usage:
+    uv run python -m benchmarks.bot_handlers --updates 5000 --users 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.env import add_storage_arguments, configure_environment
+
+
+# Relative frequency of each update kind in the load phase
+MIX = {
+    "/start": 5,
+    "/digest": 15,
+    "/settings": 30,
+    "toggle_active": 15,
+    "set_time": 15,
+    "back_to_settings": 20,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000, help="updates in the load phase")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--channels-per-user", type=int, default=3)
+    parser.add_argument("--probe", type=int, default=20, help="updates per kind in the cost phase")
+    parser.add_argument("--bot-latency", type=float, default=0.0, help="seconds per fake Bot API call")
+    add_storage_arguments(parser)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def make_update(kind: str, update_id: int, user_id: int, rng: random.Random) -> dict:
+    """Raw Update payload for one update kind, as Telegram would send it."""
+    user = {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+    chat = {"id": user_id, "type": "private"}
+    now = int(time.time())
+
+    if kind.startswith("/"):
+        return {
+            "update_id": update_id,
+            "message": {"message_id": update_id, "date": now, "chat": chat, "from": user, "text": kind},
+        }
+
+    data = f"set_time:{rng.randrange(24):02d}" if kind == "set_time" else kind
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": "benchmark",
+            "data": data,
+            "message": {"message_id": update_id, "date": now, "chat": chat, "text": "settings"},
+        },
+    }
+
+
+class QueryCounter:
+    """Counts SQL statements sent by the shared engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+
+async def run(args: argparse.Namespace) -> None:
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from aiogram.types import Update
+
+    from benchmarks.fakes import FakeBotSession
+    from benchmarks.fixtures import build_subscriptions, cleanup, clear_redis, seed_subscriptions
+    from benchmarks.report import format_table, percentile
+    from lib.bot.main import create_dispatcher
+    from lib.core.redis import close_redis
+    from lib.db.database import engine
+    from lib.worker.celery_app import app
+
+    # /digest enqueues generate_digest_task; keep it in this process
+    app.conf.broker_url = "memory://"
+
+    session = FakeBotSession(args.bot_latency)
+    bot = Bot("42:benchmark", session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = create_dispatcher()
+    queries = QueryCounter(engine)
+    rng = random.Random(args.seed)
+
+    subscriptions = build_subscriptions(args.users, args.channels, args.channels_per_user, args.seed)
+    users = list(subscriptions)
+    await cleanup()
+    await clear_redis()
+    await seed_subscriptions(subscriptions)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    update_ids = iter(range(1, 10**9))
+    errors: dict[str, int] = defaultdict(int)
+
+    async def feed(kind: str, user_id: int) -> float:
+        update = Update.model_validate(make_update(kind, next(update_ids), user_id, rng), context={"bot": bot})
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            errors[kind] += 1
+        return time.perf_counter() - started
+
+    try:
+        # Cost phase: one update at a time, so statements and calls add up per kind
+        rows = []
+        for kind in MIX:
+            await clear_redis("digest:inflight:*")
+            queries_before = queries.count
+            calls_before = sum(session.requests.values())
+            durations = [await feed(kind, users[i % len(users)]) for i in range(args.probe)]
+            rows.append([
+                kind,
+                f"{(queries.count - queries_before) / args.probe:.2f}",
+                f"{(sum(session.requests.values()) - calls_before) / args.probe:.2f}",
+                f"{percentile(durations, 0.5) * 1000:.2f}",
+            ])
+
+        print(f"\n=== cost per update ({args.probe} sequential updates per kind) ===")
+        print(format_table(["kind", "sql/update", "bot api/update", "p50 ms"], rows))
+
+        # Load phase: a weighted mix from concurrent senders
+        await clear_redis("digest:inflight:*")
+        kinds = rng.choices(list(MIX), weights=list(MIX.values()), k=args.updates)
+        work = [(kind, rng.choice(users)) for kind in kinds]
+        latencies: dict[str, list[float]] = defaultdict(list)
+        queries_before = queries.count
+        position = 0
+
+        async def sender() -> None:
+            nonlocal position
+            while position < len(work):
+                kind, user_id = work[position]
+                position += 1
+                latencies[kind].append(await feed(kind, user_id))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        rows = []
+        for kind in MIX:
+            samples = latencies[kind]
+            if not samples:
+                continue
+            rows.append([
+                kind,
+                str(len(samples)),
+                f"{percentile(samples, 0.5) * 1000:.2f}",
+                f"{percentile(samples, 0.95) * 1000:.2f}",
+                f"{percentile(samples, 0.99) * 1000:.2f}",
+                str(errors.get(kind, 0)),
+            ])
+
+        print(f"\n=== load: {args.updates} updates, concurrency {args.concurrency} ===")
+        print(f"throughput:   {args.updates / elapsed:.1f} updates/s ({elapsed:.2f}s)")
+        print(f"sql/update:   {(queries.count - queries_before) / args.updates:.2f}")
+        print(f"Bot API:      {dict(sorted(session.requests.items()))}")
+        print()
+        print(format_table(["kind", "count", "p50 ms", "p95 ms", "p99 ms", "errors"], rows))
+    finally:
+        await cleanup()
+        await clear_redis()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await close_redis()
+        await engine.dispose()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_environment(args.database_url, args.redis_url)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""Local stand-ins for MTProto, the OpenRouter API and the Bot API."""
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections.abc import AsyncGenerator, AsyncIterator
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendMessage, TelegramMethod
+from aiogram.types import Message
+from aiohttp import web
+
+
+_WORDS = (
+    "рынок акции банк компания рост падение выручка прибыль инвестиции нефть газ "
+    "санкции экспорт импорт инфляция ставка рубль доллар биржа индекс отчёт квартал "
+    "сделка слияние регулятор закон правительство бюджет налог кредит ипотека спрос "
+    "предложение производство логистика поставки технологии стартап раунд оценка "
+    "дивиденды облигации размещение аналитики прогноз снижение повышение"
+).split()
+
+_POST_LINE_RE = re.compile(r"^\[(p\d+)\] (.*)$", re.MULTILINE)
+
+
+class FakeMTProtoClient:
+    """
+    Serves synthetic channel histories in place of a Pyrogram client.
+
+    Every channel gets `posts_per_channel` posts spread over the last 20
+    hours, including albums, forwards shared between channels and
+    near-duplicate reposts, so the dedup pre-pass has real work to do.
+    Reading history costs `latency` seconds per 100 messages, like one
+    GetHistory round-trip.
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, posts_per_channel: int, latency: float, seed: int = 0):
+        self.posts_per_channel = posts_per_channel
+        self.latency = latency
+        self.seed = seed
+        self.is_connected = True
+        self.history_calls = 0
+        self._histories: dict[str, list[SimpleNamespace]] = {}
+
+    async def stop(self) -> None:
+        self.is_connected = False
+
+    async def get_me(self) -> SimpleNamespace:
+        return SimpleNamespace(id=1, username="benchmark")
+
+    async def get_chat(self, username: str) -> SimpleNamespace:
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(id=abs(hash(username)) % 10**9, username=username)
+
+    async def get_chat_history(self, username: str, limit: int = 0) -> AsyncIterator[SimpleNamespace]:
+        self.history_calls += 1
+        messages = self._history(username)
+        if limit:
+            messages = messages[:limit]
+
+        for i, message in enumerate(messages):
+            if i % self.PAGE_SIZE == 0:
+                await asyncio.sleep(self.latency)
+            yield message
+
+    def _history(self, username: str) -> list[SimpleNamespace]:
+        if username not in self._histories:
+            self._histories[username] = self._generate(username)
+        return self._histories[username]
+
+    def _generate(self, username: str) -> list[SimpleNamespace]:
+        rng = random.Random(f"{self.seed}:{username}")
+        # Forwards are drawn from a pool shared by all channels
+        shared = random.Random(self.seed)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        step = timedelta(hours=20) / max(self.posts_per_channel, 1)
+
+        messages = []
+        previous_text = ""
+        for i in range(self.posts_per_channel):
+            message_id = i + 1
+            kind = rng.random()
+            text = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(30, 120)))
+            media_group_id = None
+            forward_chat = None
+            forward_id = None
+
+            if kind < 0.1 and previous_text:
+                # Near-duplicate repost of the previous post
+                words = previous_text.split()
+                words[rng.randrange(len(words))] = rng.choice(_WORDS)
+                text = " ".join(words)
+            elif kind < 0.2:
+                media_group_id = 10_000 + i // 3
+            elif kind < 0.25:
+                forward_id = shared.randint(1, 50)
+                forward_chat = SimpleNamespace(id=-1000)
+                text = f"Пересланная новость {forward_id}: " + " ".join(_WORDS[forward_id % 10:][:40])
+
+            previous_text = text
+            messages.append(
+                SimpleNamespace(
+                    id=message_id,
+                    date=now - step * (self.posts_per_channel - i),
+                    text=text,
+                    caption=None,
+                    service=None,
+                    media_group_id=media_group_id,
+                    forward_from_chat=forward_chat,
+                    forward_from_message_id=forward_id,
+                )
+            )
+
+        # Pyrogram returns history newest first
+        messages.reverse()
+        return messages
+
+
+class BackgroundServer:
+    """Runs an aiohttp application on its own event loop in a daemon thread."""
+
+    def __init__(self, app: web.Application, host: str, port: int):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._runner: web.AppRunner | None = None
+        self._started = threading.Event()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+        if not self._started.wait(timeout=10):
+            raise RuntimeError(f"Server on port {self.port} did not start")
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def stop(self) -> None:
+        if self._runner is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class FakeLLMServer:
+    """
+    OpenAI-compatible /v1/chat/completions endpoint.
+
+    Replies after `latency` seconds (±`jitter` as a fraction, normally
+    distributed) with a digest that links the first posts of the prompt.
+    A `rate_limit_ratio` share of requests is answered with 429.
+    """
+
+    def __init__(self, latency: float, jitter: float, rate_limit_ratio: float, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.requests = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.chat_completions)
+
+    def _delay(self) -> float:
+        return max(0.0, self._rng.gauss(self.latency, self.latency * self.jitter))
+
+    @staticmethod
+    def _digest(prompt: str) -> str:
+        items = []
+        for short_id, text in _POST_LINE_RE.findall(prompt)[:8]:
+            words = text.split()
+            items.append(
+                f"<b>{' '.join(words[:4]).capitalize()}</b>\n"
+                f"{' '.join(words[4:30])}. <a href=\"{short_id}\">Источник</a>"
+            )
+        return "\n\n".join(items)
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+
+        if self._rng.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            await asyncio.sleep(self.latency * 0.05)
+            return web.json_response(
+                {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error", "code": 429}},
+                status=429,
+            )
+
+        prompt = "\n".join(m["content"] for m in body["messages"])
+        content = self._digest(prompt)
+        prompt_tokens = len(prompt) // 3
+        completion_tokens = len(content) // 3
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        delay = self._delay()
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def event(choices: list[dict], chunk_usage: dict | None = None) -> bytes:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": choices,
+                "usage": chunk_usage,
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        # A fifth of the latency before the first token, the rest spread over the stream
+        await asyncio.sleep(delay * 0.2)
+        pieces = [content[i:i + 40] for i in range(0, len(content), 40)] or [""]
+        for piece in pieces:
+            await response.write(event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+            await asyncio.sleep(delay * 0.8 / len(pieces))
+
+        await response.write(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        await response.write(event([], usage))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class FakeBotAPI:
+    """
+    Bot API stub for sendMessage and editMessageText.
+
+    Answers after `latency` seconds; a `rate_limit_ratio` share of requests
+    gets a 429 with `retry_after`.
+    """
+
+    def __init__(self, latency: float, rate_limit_ratio: float, retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.requests: dict[str, int] = {}
+        self.rate_limited = 0
+        self._next_message_id = 1
+        self._rng = random.Random(seed)
+
+        self.app = web.Application()
+        self.app.router.add_post("/{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.requests[method] = self.requests.get(method, 0) + 1
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+
+        if self._rng.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        if method == "editMessageText":
+            message_id = payload["message_id"]
+        else:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": payload.get("chat_id"), "type": "private"},
+                "text": payload.get("text", ""),
+            },
+        })
+
+
+class FakeBotSession(BaseSession):
+    """
+    aiogram session that answers Bot API calls locally, for driving the
+    dispatcher without Telegram.
+
+    sendMessage and editMessageText return a message, every other method
+    returns True. Each call takes `latency` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests: dict[str, int] = {}
+        self._next_message_id = 1
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[Any],
+        timeout: int | None = None,
+    ) -> Any:
+        name = type(method).__name__
+        self.requests[name] = self.requests.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if not isinstance(method, (SendMessage, EditMessageText)):
+            return True
+
+        if isinstance(method, EditMessageText):
+            message_id = method.message_id
+        else:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+
+        return Message.model_validate(
+            {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": method.chat_id, "type": "private"},
+                "text": method.text,
+            },
+            context={"bot": bot},
+        )
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        # The handlers never download files
+        raise NotImplementedError
+        yield b""
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,83 @@
+"""
+Benchmark data in the scratch database and Redis.
+
+Import only after the benchmark has configured its environment: lib
+modules read their settings at import time.
+"""
+
+import random
+from datetime import datetime, time as dt_time, timezone
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from lib.core.redis import get_redis
+from lib.db.database import async_session_maker
+from lib.db.models import User, UserChannel
+from lib.db.repositories import ChannelRepository
+
+
+# Far above real Telegram user ids, so cleanup never touches real users
+USER_ID_BASE = 9_000_000_000
+CHANNEL_PREFIX = "bench_channel_"
+
+
+def build_subscriptions(users: int, channels: int, per_user: int, seed: int) -> dict[int, list[str]]:
+    """Map synthetic user ids to the channel usernames they follow."""
+    rng = random.Random(seed)
+    names = [f"{CHANNEL_PREFIX}{i}" for i in range(channels)]
+    per_user = min(per_user, channels)
+    return {USER_ID_BASE + i: sorted(rng.sample(names, per_user)) for i in range(users)}
+
+
+async def seed_subscriptions(subscriptions: dict[int, list[str]]) -> None:
+    """Create the users, due at the current UTC hour, and their subscriptions."""
+    schedule = dt_time(datetime.now(timezone.utc).hour, 0)
+    usernames = sorted({c for channels in subscriptions.values() for c in channels})
+
+    async with async_session_maker() as session:
+        repo = ChannelRepository(session)
+        channel_ids = {name: (await repo.get_or_create(name)).id for name in usernames}
+
+        query = insert(User).values([
+            {
+                "telegram_id": user_id,
+                "username": f"bench{user_id}",
+                "schedule_time": schedule,
+                "is_active": True,
+            }
+            for user_id in subscriptions
+        ])
+        await session.execute(
+            query.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={"schedule_time": schedule, "is_active": True},
+            )
+        )
+        await session.execute(
+            insert(UserChannel)
+            .values([
+                {"user_id": user_id, "channel_id": channel_ids[name]}
+                for user_id, channels in subscriptions.items()
+                for name in channels
+            ])
+            .on_conflict_do_nothing()
+        )
+        await session.commit()
+
+
+async def cleanup() -> None:
+    """Delete everything the benchmarks created in Postgres."""
+    async with async_session_maker() as session:
+        # Subscriptions and digest logs go with their users (ON DELETE CASCADE)
+        await session.execute(text("DELETE FROM users WHERE telegram_id >= :base"), {"base": USER_ID_BASE})
+        await session.execute(text("DELETE FROM channels WHERE username LIKE :p"), {"p": f"{CHANNEL_PREFIX}%"})
+        await session.execute(text("DELETE FROM posts WHERE channel LIKE :p"), {"p": f"{CHANNEL_PREFIX}%"})
+        await session.commit()
+
+
+async def clear_redis(pattern: str = "digest:*") -> None:
+    redis = get_redis()
+    keys = [key async for key in redis.scan_iter(match=pattern, count=1000)]
+    for i in range(0, len(keys), 1000):
+        await redis.delete(*keys[i:i + 1000])
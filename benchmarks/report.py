@@ -0,0 +1,50 @@
+"""Percentiles and plain-text tables for benchmark reports."""
+
+from lib.core.metrics import Histogram
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """Exact percentile (0 <= q <= 1) with linear interpolation."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def histogram_quantile(histogram: Histogram, q: float) -> float | None:
+    """
+    Estimate a quantile over all label sets of a histogram.
+
+    Interpolates linearly inside the bucket that holds the quantile, like
+    Prometheus' histogram_quantile, so the result is only as precise as the
+    bucket bounds. Returns None if nothing was observed.
+    """
+    counts, _, total = histogram.merged()
+    if total == 0:
+        return None
+
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(histogram.buckets, counts):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    # The quantile is in the +Inf bucket
+    return histogram.buckets[-1]
+
+
+def format_table(header: list[str], rows: list[list[str]]) -> str:
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    lines = [
+        "  ".join(str(cell).ljust(width) for cell, width in zip(header, widths)),
+        "  ".join("-" * width for width in widths),
+    ]
+    lines.extend(
+        "  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)) for row in rows
+    )
+    return "\n".join(lines)
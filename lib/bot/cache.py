@@ -0,0 +1,130 @@
+"""In-process LRU+TTL cache of user settings, kept consistent through Redis pub/sub."""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import time as dt_time
+
+from lib.core.config import settings
+from lib.core.constants import USER_CHANGES_CHANNEL
+from lib.core.redis import get_redis
+from lib.db.database import async_session_maker
+from lib.db.models import User
+from lib.db.repositories import UserRepository
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedChannel:
+    id: int
+    username: str
+
+
+@dataclass(frozen=True)
+class UserSettings:
+    """Read-only snapshot of the user fields the handlers need."""
+
+    telegram_id: int
+    schedule_time: dt_time | None
+    is_active: bool
+    channels: tuple[CachedChannel, ...]
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSettings":
+        return cls(
+            telegram_id=user.telegram_id,
+            schedule_time=user.schedule_time,
+            is_active=user.is_active,
+            channels=tuple(CachedChannel(id=c.id, username=c.username) for c in user.channels),
+        )
+
+
+class UserSettingsCache:
+    """
+    Bounded LRU cache of `UserSettings` with a TTL per entry.
+
+    Repositories publish the id of every user they change on
+    `USER_CHANGES_CHANNEL`; `listen` drops those entries in every bot
+    process. The TTL bounds staleness if a message is lost.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[float, UserSettings]] = OrderedDict()
+        # Bumped on every invalidation so a load that raced with a write isn't stored
+        self._generation = 0
+
+    async def get(self, telegram_id: int) -> UserSettings | None:
+        """Return the user's settings, loading them from Postgres on a miss."""
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            expires_at, user_settings = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                return user_settings
+            del self._entries[telegram_id]
+
+        generation = self._generation
+        async with async_session_maker() as session:
+            user = await UserRepository(session).get_by_id(telegram_id)
+            if user is None:
+                return None
+            user_settings = UserSettings.from_user(user)
+
+        if generation == self._generation:
+            self._store(user_settings)
+        return user_settings
+
+    def put(self, user: User) -> UserSettings:
+        """Cache a freshly written user; call while its session is still open."""
+        user_settings = UserSettings.from_user(user)
+        self._store(user_settings)
+        return user_settings
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._generation += 1
+        self._entries.pop(telegram_id, None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def _store(self, user_settings: UserSettings) -> None:
+        self._entries[user_settings.telegram_id] = (time.monotonic() + self.ttl, user_settings)
+        self._entries.move_to_end(user_settings.telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def listen(self) -> None:
+        """Apply invalidations published by any process until cancelled."""
+        delay = 1.0
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(USER_CHANGES_CHANNEL)
+                # Changes may have been missed while unsubscribed
+                self.clear()
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.invalidate(int(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"User cache invalidation listener failed, retrying in {delay}s: {e}")
+                self.clear()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                await pubsub.aclose()
+
+
+user_cache = UserSettingsCache(
+    ttl=settings.user_cache_ttl,
+    max_entries=settings.user_cache_max_entries,
+)
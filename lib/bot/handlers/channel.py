@@ -1,23 +1,35 @@
+import asyncio
+import logging
+import time
+
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message
+from aiogram.types import CallbackQuery, Message
 
+from lib.bot.cache import user_cache
+from lib.bot.keyboards import get_channels_keyboard
+from lib.core.config import settings as app_settings
 from lib.db.database import async_session_maker
-from lib.db.repositories import UserRepository
-from lib.worker.scraper import test_channel_access
+from lib.db.repositories import ChannelRepository, UserRepository
+from lib.worker.resolver import FAILED, RESOLVED, get_cached_resolution
+from lib.worker.tasks import resolve_channel_task
+
 
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+RESOLVE_POLL_INTERVAL = 0.2  # seconds
+
 
 class SetChannelState(StatesGroup):
     waiting_for_channel = State()
 
 
-@router.message(Command("set_channel"))
-async def cmd_set_channel(message: Message, state: FSMContext) -> None:
+@router.message(Command("add_channel", "set_channel"))
+async def cmd_add_channel(message: Message, state: FSMContext) -> None:
     # Check if channel provided as argument
     if message.text and len(message.text.split()) > 1:
         channel = message.text.split(maxsplit=1)[1].strip()
@@ -50,12 +62,30 @@ async def _process_channel(message: Message, state: FSMContext, channel: str) ->
         await message.answer("Некорректный юзернейм канала. Попробуй ещё раз.")
         return
 
-    # Validate channel
-    await message.answer("Проверяю доступ к каналу...")
+    async with async_session_maker() as session:
+        repo = UserRepository(session)
+        await repo.get_or_create(message.from_user.id, message.from_user.username)
+        channels_count = await repo.count_channels(message.from_user.id)
 
-    is_accessible = await test_channel_access(channel)
+    if channels_count >= app_settings.max_channels_per_user:
+        await state.clear()
+        await message.answer(
+            f"Можно подписаться не более чем на {app_settings.max_channels_per_user} каналов.\n\n"
+            "Удали лишний канал командой /remove_channel"
+        )
+        return
+
+    # Validate channel: repeated lookups are answered from the worker's cache
+    resolution = await get_cached_resolution(channel)
+    if resolution is None:
+        await message.answer("Проверяю доступ к каналу...")
+        resolution = await _resolve_on_worker(channel)
+
+    if resolution["status"] == FAILED:
+        await message.answer("Не удалось проверить канал. Попробуй ещё раз через минуту.")
+        return
 
-    if not is_accessible:
+    if resolution["status"] != RESOLVED:
         await message.answer(
             f"Не удалось получить доступ к каналу <code>{channel}</code>.\n\n"
             "Убедись, что:\n"
@@ -65,13 +95,114 @@ async def _process_channel(message: Message, state: FSMContext, channel: str) ->
         )
         return
 
+    channel = resolution["username"]
+
     # Save to database
     async with async_session_maker() as session:
-        repo = UserRepository(session)
-        await repo.update_channel(message.from_user.id, channel)
+        channel_row = await ChannelRepository(session).get_or_create(channel)
+        added = await UserRepository(session).add_channel(message.from_user.id, channel_row.id)
 
     await state.clear()
+
+    if not added:
+        await message.answer(f"Канал <code>@{channel}</code> уже есть в твоих подписках.")
+        return
+
     await message.answer(
-        f"Канал <code>@{channel}</code> успешно установлен!\n\n"
+        f"Канал <code>@{channel}</code> добавлен!\n\n"
         "Теперь можешь получить дайджест командой /digest"
     )
+
+
+async def _resolve_on_worker(channel: str) -> dict:
+    """Run resolve_channel_task and poll the resolver's Redis cache for its outcome."""
+    try:
+        resolve_channel_task.delay(channel)
+        deadline = time.monotonic() + app_settings.channel_resolve_timeout
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(RESOLVE_POLL_INTERVAL)
+            resolution = await get_cached_resolution(channel)
+            if resolution is not None:
+                return resolution
+
+        logger.warning(
+            f"Channel resolution of {channel} timed out after {app_settings.channel_resolve_timeout}s"
+        )
+    except Exception as e:
+        logger.warning(f"Channel resolution of {channel} failed: {e}")
+
+    return {"status": FAILED, "username": channel}
+
+
+@router.message(Command("channels"))
+async def cmd_channels(message: Message) -> None:
+    if not message.from_user:
+        return
+
+    user = await user_cache.get(message.from_user.id)
+
+    if not user or not user.channels:
+        await message.answer("У тебя пока нет каналов. Добавь канал командой /add_channel")
+        return
+
+    channels = "\n".join(f"• @{c.username}" for c in user.channels)
+    await message.answer(f"<b>Твои каналы:</b>\n\n{channels}")
+
+
+@router.message(Command("remove_channel"))
+async def cmd_remove_channel(message: Message) -> None:
+    if not message.from_user:
+        return
+
+    # Channel provided as argument
+    if message.text and len(message.text.split()) > 1:
+        channel = message.text.split(maxsplit=1)[1].strip().lstrip("@")
+
+        async with async_session_maker() as session:
+            channel_row = await ChannelRepository(session).get_by_username(channel)
+            removed = channel_row is not None and await UserRepository(session).remove_channel(
+                message.from_user.id, channel_row.id
+            )
+
+        if removed:
+            await message.answer(f"Канал <code>@{channel}</code> удалён из подписок.")
+        else:
+            await message.answer(f"Канала <code>@{channel}</code> нет в твоих подписках.")
+        return
+
+    user = await user_cache.get(message.from_user.id)
+
+    if not user or not user.channels:
+        await message.answer("У тебя пока нет каналов. Добавь канал командой /add_channel")
+        return
+
+    await message.answer(
+        "Выбери канал, который нужно удалить:",
+        reply_markup=get_channels_keyboard(user.channels),
+    )
+
+
+@router.callback_query(F.data.startswith("remove_channel:"))
+async def remove_channel(callback: CallbackQuery) -> None:
+    if not callback.from_user or not callback.message or not callback.data:
+        return
+
+    channel_id = int(callback.data.split(":")[1])
+
+    async with async_session_maker() as session:
+        repo = UserRepository(session)
+        await repo.remove_channel(callback.from_user.id, channel_id)
+        user = await repo.get_by_id(callback.from_user.id)
+        if user:
+            user = user_cache.put(user)
+
+    if user and user.channels:
+        await callback.message.edit_text(
+            "Выбери канал, который нужно удалить:",
+            reply_markup=get_channels_keyboard(user.channels),
+        )
+    else:
+        await callback.message.edit_text("Все каналы удалены. Добавь новый командой /add_channel")
+
+    await callback.answer("Канал удалён")
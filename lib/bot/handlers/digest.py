@@ -2,8 +2,9 @@ from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
 
-from lib.db.database import async_session_maker
-from lib.db.repositories import UserRepository
+from lib.bot.cache import user_cache
+from lib.core.tracing import new_trace_id, trace
+from lib.worker.singleflight import finish_user_digest, try_start_user_digest
 from lib.worker.tasks import generate_digest_task
 
 
@@ -15,9 +16,7 @@ async def cmd_digest(message: Message) -> None:
     if not message.from_user:
         return
 
-    async with async_session_maker() as session:
-        repo = UserRepository(session)
-        user = await repo.get_by_id(message.from_user.id)
+    user = await user_cache.get(message.from_user.id)
 
     if not user:
         await message.answer(
@@ -25,19 +24,37 @@ async def cmd_digest(message: Message) -> None:
         )
         return
 
-    if not user.target_channel:
+    if not user.channels:
         await message.answer(
-            "Сначала укажи канал для дайджеста командой /set_channel"
+            "Сначала добавь канал для дайджеста командой /add_channel"
         )
         return
 
-    await message.answer(
-        f"Генерирую дайджест из канала <code>@{user.target_channel}</code>...\n\n"
-        "Это может занять некоторое время."
-    )
+    # One manual digest per user at a time; repeated taps don't queue more work
+    if not await try_start_user_digest(message.from_user.id):
+        await message.answer("Дайджест уже готовится и появится в сообщении выше. Подожди немного.")
+        return
 
-    # Send task to Celery
-    generate_digest_task.delay(
-        user_id=message.from_user.id,
-        channel=user.target_channel,
-    )
+    channels = [c.username for c in user.channels]
+    channels_text = ", ".join(f"<code>@{c}</code>" for c in channels)
+
+    # The trace id follows this digest through the bot and worker logs
+    trace_id = new_trace_id()
+    with trace(trace_id):
+        try:
+            placeholder = await message.answer(
+                f"Генерирую дайджест из {channels_text}...\n\n"
+                "Это может занять некоторое время."
+            )
+
+            # Send task to Celery; the worker streams the digest into the placeholder
+            # and clears the in-flight mark when done
+            generate_digest_task.delay(
+                user_id=message.from_user.id,
+                channels=channels,
+                message_id=placeholder.message_id,
+                trace_id=trace_id,
+            )
+        except Exception:
+            await finish_user_digest(message.from_user.id)
+            raise
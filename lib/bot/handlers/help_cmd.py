@@ -2,8 +2,7 @@ from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
 
-from lib.db.database import async_session_maker
-from lib.db.repositories import UserRepository
+from lib.bot.cache import user_cache
 
 
 router = Router()
@@ -14,9 +13,7 @@ async def cmd_help(message: Message) -> None:
     if not message.from_user:
         return
 
-    async with async_session_maker() as session:
-        repo = UserRepository(session)
-        user = await repo.get_by_id(message.from_user.id)
+    user = await user_cache.get(message.from_user.id)
 
     if not user:
         await message.answer(
@@ -28,12 +25,14 @@ async def cmd_help(message: Message) -> None:
         """
 <b>Помощь по использованию бота:</b>
 <b>Как начать:</b>
-1. Укажи канал командой /set_channel
+1. Добавь каналы командой /add_channel
 2. Получи дайджест командой /digest
 3. Настрой автоматическую рассылку в /settings
 
 <b>Команды:</b>
-/set_channel — указать канал для дайджеста
+/add_channel — добавить канал в дайджест
+/remove_channel — удалить канал
+/channels — список каналов
 /digest — получить дайджест сейчас
 /settings — настройки рассылки
 /help — помощь
@@ -4,6 +4,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message
 
+from lib.bot.cache import UserSettings, user_cache
 from lib.bot.keyboards import get_settings_keyboard, get_time_keyboard
 from lib.db.database import async_session_maker
 from lib.db.repositories import UserRepository
@@ -16,14 +17,14 @@ class SettingsState(StatesGroup):
     waiting_for_time = State()
 
 
-def _format_settings(user) -> str:
-    channel = f"@{user.target_channel}" if user.target_channel else "не указан"
+def _format_settings(user: UserSettings) -> str:
+    channels = ", ".join(f"@{c.username}" for c in user.channels) or "не указаны"
     schedule = user.schedule_time.strftime("%H:%M") if user.schedule_time else "09:00"
     status = "включена" if user.is_active else "выключена"
 
     return (
         "<b>Текущие настройки:</b>\n\n"
-        f"<b>Канал:</b> {channel}\n"
+        f"<b>Каналы:</b> {channels}\n"
         f"<b>Время рассылки:</b> {schedule} UTC\n"
         f"<b>Автоматическая рассылка:</b> {status}"
     )
@@ -34,9 +35,7 @@ async def cmd_settings(message: Message) -> None:
     if not message.from_user:
         return
 
-    async with async_session_maker() as session:
-        repo = UserRepository(session)
-        user = await repo.get_by_id(message.from_user.id)
+    user = await user_cache.get(message.from_user.id)
 
     if not user:
         await message.answer("Ты ещё не зарегистрирован. Нажми /start для начала.")
@@ -55,12 +54,9 @@ async def toggle_active(callback: CallbackQuery) -> None:
 
     async with async_session_maker() as session:
         repo = UserRepository(session)
-        user = await repo.get_by_id(callback.from_user.id)
-
+        user = await repo.toggle_active(callback.from_user.id)
         if user:
-            new_status = not user.is_active
-            await repo.set_active(callback.from_user.id, new_status)
-            user = await repo.get_by_id(callback.from_user.id)
+            user = user_cache.put(user)
 
     if user:
         await callback.message.edit_text(
@@ -93,8 +89,9 @@ async def set_time(callback: CallbackQuery) -> None:
 
     async with async_session_maker() as session:
         repo = UserRepository(session)
-        await repo.update_schedule(callback.from_user.id, hour, 0)
-        user = await repo.get_by_id(callback.from_user.id)
+        user = await repo.update_schedule(callback.from_user.id, hour, 0)
+        if user:
+            user = user_cache.put(user)
 
     if user:
         await callback.message.edit_text(
@@ -110,9 +107,7 @@ async def back_to_settings(callback: CallbackQuery) -> None:
     if not callback.from_user or not callback.message:
         return
 
-    async with async_session_maker() as session:
-        repo = UserRepository(session)
-        user = await repo.get_by_id(callback.from_user.id)
+    user = await user_cache.get(callback.from_user.id)
 
     if user:
         await callback.message.edit_text(
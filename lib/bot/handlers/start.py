@@ -11,15 +11,17 @@ router = Router()
 WELCOME_MESSAGE = """
 <b>Привет! Я бот для создания дайджестов новостей.</b>
 
-Я могу каждый день присылать тебе краткую сводку новостей из любого публичного Telegram-канала.
+Я могу каждый день присылать тебе краткую сводку новостей из публичных Telegram-каналов.
 
 <b>Как начать:</b>
-1. Укажи канал командой /set_channel
+1. Добавь каналы командой /add_channel
 2. Получи дайджест командой /digest
 3. Настрой автоматическую рассылку в /settings
 
 <b>Команды:</b>
-/set_channel — указать канал для дайджеста
+/add_channel — добавить канал в дайджест
+/remove_channel — удалить канал
+/channels — список каналов
 /digest — получить дайджест сейчас
 /settings — настройки рассылки
 /help — помощь
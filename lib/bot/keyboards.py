@@ -1,5 +1,9 @@
+from collections.abc import Sequence
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from lib.bot.cache import CachedChannel
+
 
 def get_settings_keyboard(is_active: bool) -> InlineKeyboardMarkup:
     toggle_text = "Выключить рассылку" if is_active else "Включить рассылку"
@@ -52,3 +56,17 @@ def get_time_keyboard() -> InlineKeyboardMarkup:
     ])
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_channels_keyboard(channels: Sequence[CachedChannel]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text=f"Удалить @{channel.username}",
+                    callback_data=f"remove_channel:{channel.id}",
+                ),
+            ]
+            for channel in channels
+        ]
+    )
@@ -4,36 +4,120 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
+from lib.bot.cache import user_cache
 from lib.bot.handlers import channel, digest, settings, start, help_cmd
+from lib.bot.middlewares import HandlerMetricsMiddleware
 from lib.core.config import settings as app_settings
+from lib.core.metrics import start_metrics_server
+from lib.core.redis import close_redis
+from lib.core.tracing import install_trace_filter
 
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    format="%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s",
 )
+install_trace_filter()
 logger = logging.getLogger(__name__)
 
 
+def create_dispatcher(storage: BaseStorage | None = None) -> Dispatcher:
+    """
+    Build the dispatcher with all routers and lifecycle hooks.
+
+    Routers are module-level singletons, so this can be called only once
+    per process.
+    """
+    dp = Dispatcher(storage=storage or MemoryStorage())
+
+    # Register routers, each with its own handler latency metrics
+    for module in (start, channel, digest, settings, help_cmd):
+        name = module.__name__.rsplit(".", 1)[-1]
+        module.router.message.middleware(HandlerMetricsMiddleware(name, "message"))
+        module.router.callback_query.middleware(HandlerMetricsMiddleware(name, "callback_query"))
+        dp.include_router(module.router)
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher) -> None:
+    # Keeps the user settings cache consistent with writes from other processes
+    dispatcher["cache_listener"] = asyncio.create_task(user_cache.listen())
+
+    if app_settings.bot_mode == "webhook":
+        # Every replica sets the same webhook, so this is idempotent
+        await bot.set_webhook(
+            url=f"{app_settings.webhook_url.rstrip('/')}{app_settings.webhook_path}",
+            secret_token=app_settings.webhook_secret,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+    else:
+        # Polling doesn't work while a webhook is set
+        await bot.delete_webhook()
+
+
+async def on_shutdown(dispatcher: Dispatcher) -> None:
+    cache_listener = dispatcher.get("cache_listener")
+    if cache_listener is not None:
+        cache_listener.cancel()
+        await asyncio.gather(cache_listener, return_exceptions=True)
+
+    await dispatcher.storage.close()
+    await close_redis()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Serve updates over HTTP; any number of replicas can run behind a load balancer."""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=app_settings.webhook_secret,
+    ).register(app, path=app_settings.webhook_path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=app_settings.webhook_host, port=app_settings.webhook_port)
+    await site.start()
+    logger.info(
+        f"Webhook server listening on {app_settings.webhook_host}:{app_settings.webhook_port}"
+        f"{app_settings.webhook_path}"
+    )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
+
 async def main() -> None:
     bot = Bot(
         token=app_settings.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
-    dp = Dispatcher()
+    # FSM state lives in Redis so it survives restarts and is shared by replicas
+    dp = create_dispatcher(RedisStorage.from_url(app_settings.redis_url))
 
-    # Register routers
-    dp.include_router(start.router)
-    dp.include_router(channel.router)
-    dp.include_router(digest.router)
-    dp.include_router(settings.router)
-    dp.include_router(help_cmd.router)
+    if app_settings.metrics_enabled:
+        start_metrics_server(app_settings.bot_metrics_port)
 
-    logger.info("Starting bot...")
+    logger.info(f"Starting bot in {app_settings.bot_mode} mode...")
 
-    await dp.start_polling(bot)
+    if app_settings.bot_mode == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from lib.core.metrics import Counter, Histogram
+
+
+HANDLER_LATENCY = Histogram(
+    "digest_bot_handler_seconds",
+    "Latency of bot handlers, including their Telegram and database calls",
+    ("router", "event"),
+)
+HANDLER_ERRORS = Counter(
+    "digest_bot_handler_errors_total",
+    "Bot handlers that raised",
+    ("router", "event"),
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Times every handler of the router it is registered on."""
+
+    def __init__(self, router: str, event: str):
+        self.router = router
+        self.event = event
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(router=self.router, event=self.event)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(
+                time.perf_counter() - started, router=self.router, event=self.event
+            )
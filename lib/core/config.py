@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,6 +12,21 @@ class Settings(BaseSettings):
 
     # Telegram Bot
     bot_token: str
+    telegram_api_url: str = "https://api.telegram.org"
+    # Bot API sending limits. The global rate is bot-wide: one Redis token
+    # bucket is shared by every worker process and container
+    telegram_global_rate: float = 30.0  # messages per second
+    telegram_chat_interval: float = 1.0  # seconds between messages to one chat
+    stream_edit_interval: float = 1.5  # min seconds between live edits of a streamed digest
+    delivery_concurrency: int = 20  # users of one delivery batch served at once
+
+    # How the bot receives updates: "polling" (single process) or "webhook"
+    bot_mode: Literal["polling", "webhook"] = "polling"
+    webhook_url: str = ""  # public base URL Telegram posts updates to, e.g. https://bot.example.com
+    webhook_path: str = "/webhook"
+    webhook_secret: str | None = None  # checked against X-Telegram-Bot-Api-Secret-Token
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
 
     # Pyrogram (userbot)
     api_id: int
@@ -20,6 +37,29 @@ class Settings(BaseSettings):
     openrouter_api_key: str
     openrouter_base_url: str = "https://openrouter.ai/api/v1"
     openrouter_model: str = "tngtech/deepseek-r1t2-chimera:free"
+    # Tried in order when the primary model fails or its circuit is open (JSON list in env)
+    openrouter_fallback_models: list[str] = []
+    llm_breaker_failures: int = 5  # consecutive failures that open a model's circuit
+    llm_breaker_cooldown: float = 60.0  # seconds before a half-open trial call
+    prompt_token_budget: int = 12000  # estimated tokens for system prompt + posts
+
+    # OpenRouter concurrency, shared by all workers and adjusted with AIMD
+    llm_initial_concurrency: float = 4.0
+    llm_min_concurrency: int = 1
+    llm_max_concurrency: int = 32
+    llm_target_latency: float = 30.0  # seconds; slower calls shrink the limit
+    llm_acquire_timeout: float = 180.0  # seconds to wait for a free slot
+    llm_slot_lease: float = 240.0  # seconds before a held slot is considered leaked
+    # Manual digests use a separate limiter of their own, on top of the shared
+    # one, so they never wait behind a scheduled fan-out
+    llm_interactive_concurrency: int = 2
+    llm_request_timeout: float = 60.0  # seconds per HTTP request to OpenRouter
+    # All attempts and fallback models of one digest, slot waits included
+    llm_generation_timeout: float = 200.0  # seconds
+
+    # Digest tasks are interrupted at the soft limit, before the 300 s hard
+    # limit kills them, so they can still report an error
+    task_soft_time_limit: int = 270  # seconds
 
     # Database
     database_url: str
@@ -27,6 +67,53 @@ class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379/0"
 
+    # Incremental scraping
+    history_retention_hours: int = 48  # lookback of the first sync of a channel
+    posts_retention_days: int = 7  # older daily partitions of `posts` are dropped
+    scrape_warn_messages: int = 1000  # warn when one sync reads more messages
+
+    # Post cache (shared between all users of a channel)
+    post_cache_ttl: int = 900  # seconds
+    post_cache_max_entries: int = 5000
+    post_cache_max_bytes: int = 1024 * 1024  # compressed payload limit per channel
+
+    # Digest cache (identical post sets reuse one LLM completion)
+    digest_cache_ttl: int = 24 * 60 * 60  # seconds
+    # Digests from a fallback model are only kept long enough for concurrent
+    # requests to share them, then the primary model is asked again
+    digest_fallback_cache_ttl: int = 5 * 60  # seconds
+
+    # Channels of one manual digest prepared at once
+    digest_channel_concurrency: int = 4
+
+    # A user's manual digest counts as in flight for at most this long
+    digest_inflight_ttl: int = 600  # seconds
+
+    # Buffered digest log writes
+    digest_log_flush_size: int = 500
+
+    # Bot-side cache of user settings, invalidated through Redis pub/sub
+    user_cache_ttl: float = 300.0  # seconds
+    user_cache_max_entries: int = 10000
+
+    # Channel resolution, done by the worker on behalf of the bot
+    channel_resolve_ttl: int = 24 * 60 * 60  # seconds to cache an existing channel
+    channel_resolve_negative_ttl: int = 10 * 60  # seconds to cache a missing one
+    channel_resolve_timeout: float = 30.0  # seconds the bot waits for the worker
+
+    # Prometheus metrics: worker pool process N listens on worker_metrics_port + N
+    metrics_enabled: bool = True
+    worker_metrics_port: int = 9100
+    bot_metrics_port: int = 9090
+
+    # Opt-in cProfile capture of Celery tasks (.prof files in profile_dir)
+    profile_tasks: list[str] = []  # task names always profiled (JSON list in env)
+    profile_sample_rate: float = 0.0  # share of other task runs to profile
+    profile_dir: str = "profiles"
+
+    # Subscriptions
+    max_channels_per_user: int = 10
+
     # Celery Beat Schedule
     digest_hour: int = 9
     digest_minute: int = 0
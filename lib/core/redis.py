@@ -0,0 +1,21 @@
+from redis.asyncio import Redis
+
+from lib.core.config import settings
+
+
+_redis: Redis | None = None
+
+
+def get_redis() -> Redis:
+    """Return the process-wide async Redis client, creating it on first use."""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.redis_url)
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
@@ -0,0 +1,60 @@
+"""Trace ids that follow one request across the bot and worker logs."""
+
+import logging
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# "-" keeps log lines aligned when there is no trace
+NO_TRACE = "-"
+
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default=NO_TRACE)
+
+logger = logging.getLogger(__name__)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_trace_id() -> str | None:
+    trace_id = trace_id_var.get()
+    return None if trace_id == NO_TRACE else trace_id
+
+
+@contextmanager
+def trace(trace_id: str | None) -> Iterator[None]:
+    """Attach `trace_id` (a new one if None) to everything logged in the block."""
+    token = trace_id_var.set(trace_id or new_trace_id())
+    try:
+        yield
+    finally:
+        trace_id_var.reset(token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Log how long a stage of the current trace took."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(f"span {name} took {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_id` to every record so formats can use %(trace_id)s."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def install_trace_filter(logger: logging.Logger | None = None) -> None:
+    """Add the trace id filter to every handler of a logger (the root logger by default)."""
+    for handler in (logger or logging.getLogger()).handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
@@ -1,6 +1,6 @@
 from datetime import datetime, time
 
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, String, Time, func
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, String, Text, Time, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -13,7 +13,6 @@ class User(Base):
 
     telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     username: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    target_channel: Mapped[str | None] = mapped_column(String(255), nullable=True)
     schedule_time: Mapped[time] = mapped_column(Time, default=time(9, 0))
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     created_at: Mapped[datetime] = mapped_column(
@@ -27,11 +26,53 @@ class User(Base):
     )
 
     digest_logs: Mapped[list["DigestLog"]] = relationship(back_populates="user")
+    channels: Mapped[list["Channel"]] = relationship(
+        secondary="user_channels",
+        order_by="Channel.username",
+        lazy="selectin",
+    )
 
     def __repr__(self) -> str:
         return f"<User {self.telegram_id}>"
 
 
+class Channel(Base):
+    __tablename__ = "channels"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    username: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)  # lowercase, without @
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+
+    def __repr__(self) -> str:
+        return f"<Channel {self.username}>"
+
+
+class UserChannel(Base):
+    __tablename__ = "user_channels"
+
+    user_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("users.telegram_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    channel_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("channels.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+
+    def __repr__(self) -> str:
+        return f"<UserChannel {self.user_id} -> {self.channel_id}>"
+
+
 class DigestLog(Base):
     __tablename__ = "digest_logs"
 
@@ -44,6 +85,7 @@ class DigestLog(Base):
     channel: Mapped[str] = mapped_column(String(255), nullable=False)
     items_count: Mapped[int] = mapped_column(Integer, default=0)
     tokens_used: Mapped[int] = mapped_column(Integer, default=0)
+    model: Mapped[str | None] = mapped_column(String(255), nullable=True)  # model that served the digest
     status: Mapped[str] = mapped_column(String(50), default="success")  # success, error, no_content
     error_message: Mapped[str | None] = mapped_column(String(1000), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
@@ -55,3 +97,24 @@ class DigestLog(Base):
 
     def __repr__(self) -> str:
         return f"<DigestLog {self.id} for user {self.user_id}>"
+
+
+class ChannelPost(Base):
+    __tablename__ = "posts"
+    # Daily partitions are created on write and dropped by retention (see migrations)
+    __table_args__ = {"postgresql_partition_by": "RANGE (posted_at)"}
+
+    channel: Mapped[str] = mapped_column(String(255), primary_key=True)
+    message_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    posted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    link: Mapped[str] = mapped_column(String(512), nullable=False)
+    media_group_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    forward_key: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ChannelPost {self.channel}/{self.message_id}>"
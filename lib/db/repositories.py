@@ -1,9 +1,25 @@
-from datetime import time
+import logging
+from datetime import date, datetime, time
 
-from sqlalchemy import select
+from sqlalchemy import delete, func, not_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from lib.db.models import DigestLog, User
+from lib.core.constants import USER_CHANGES_CHANNEL
+from lib.core.redis import get_redis
+from lib.db.models import Channel, ChannelPost, DigestLog, User, UserChannel
+
+
+logger = logging.getLogger(__name__)
+
+
+async def publish_user_changed(telegram_id: int) -> None:
+    """Tell every bot process to drop its cached settings of a user."""
+    try:
+        await get_redis().publish(USER_CHANGES_CHANNEL, telegram_id)
+    except Exception as e:
+        # The write itself succeeded; caches fall back to their TTL
+        logger.warning(f"Failed to publish change of user {telegram_id}: {e}")
 
 
 class UserRepository:
@@ -14,16 +30,23 @@ class UserRepository:
         return await self.session.get(User, telegram_id)
 
     async def get_or_create(self, telegram_id: int, username: str | None = None) -> User:
-        user = await self.get_by_id(telegram_id)
-        if user is None:
-            user = User(telegram_id=telegram_id, username=username)
-            self.session.add(user)
-            await self.session.commit()
-            await self.session.refresh(user)
+        """Insert the user or refresh the username of an existing one, in one statement."""
+        query = insert(User).values(telegram_id=telegram_id, username=username)
+        query = (
+            query.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={"username": func.coalesce(query.excluded.username, User.username)},
+            )
+            .returning(User)
+            .execution_options(populate_existing=True)
+        )
+        user = await self.session.scalar(query)
+        await self.session.commit()
+        await publish_user_changed(telegram_id)
         return user
 
     async def get_all_active(self) -> list[User]:
-        query = select(User).where(User.is_active == True, User.target_channel.isnot(None))
+        query = select(User).where(User.is_active == True, User.channels.any())
         result = await self.session.execute(query)
         return list(result.scalars().all())
 
@@ -31,35 +54,98 @@ class UserRepository:
         schedule = time(hour, minute)
         query = select(User).where(
             User.is_active == True,
-            User.target_channel.isnot(None),
+            User.channels.any(),
             User.schedule_time == schedule,
         )
         result = await self.session.execute(query)
         return list(result.scalars().all())
 
-    async def update_channel(self, telegram_id: int, channel: str) -> User | None:
-        user = await self.get_by_id(telegram_id)
-        if user:
-            user.target_channel = channel
-            await self.session.commit()
-            await self.session.refresh(user)
+    async def get_scheduled_subscriptions(self, hour: int, minute: int) -> list[tuple[int, int, str]]:
+        """Return (user_id, channel_id, channel username) of active users due at this time."""
+        query = (
+            select(UserChannel.user_id, Channel.id, Channel.username)
+            .join(User, User.telegram_id == UserChannel.user_id)
+            .join(Channel, Channel.id == UserChannel.channel_id)
+            .where(User.is_active == True, User.schedule_time == time(hour, minute))
+        )
+        result = await self.session.execute(query)
+        return [tuple(row) for row in result.all()]
+
+    async def count_channels(self, telegram_id: int) -> int:
+        query = select(func.count()).select_from(UserChannel).where(UserChannel.user_id == telegram_id)
+        result = await self.session.execute(query)
+        return result.scalar_one()
+
+    async def add_channel(self, telegram_id: int, channel_id: int) -> bool:
+        """Subscribe a user to a channel. Returns False if already subscribed."""
+        query = (
+            insert(UserChannel)
+            .values(user_id=telegram_id, channel_id=channel_id)
+            .on_conflict_do_nothing()
+        )
+        result = await self.session.execute(query)
+        await self.session.commit()
+        if result.rowcount > 0:
+            await publish_user_changed(telegram_id)
+        return result.rowcount > 0
+
+    async def remove_channel(self, telegram_id: int, channel_id: int) -> bool:
+        """Unsubscribe a user from a channel. Returns False if not subscribed."""
+        query = delete(UserChannel).where(
+            UserChannel.user_id == telegram_id,
+            UserChannel.channel_id == channel_id,
+        )
+        result = await self.session.execute(query)
+        await self.session.commit()
+        if result.rowcount > 0:
+            await publish_user_changed(telegram_id)
+        return result.rowcount > 0
+
+    async def _update_returning(self, telegram_id: int, **values) -> User | None:
+        query = (
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(**values)
+            .returning(User)
+            .execution_options(populate_existing=True)
+        )
+        user = await self.session.scalar(query)
+        await self.session.commit()
+        if user is not None:
+            await publish_user_changed(telegram_id)
         return user
 
     async def update_schedule(self, telegram_id: int, hour: int, minute: int) -> User | None:
-        user = await self.get_by_id(telegram_id)
-        if user:
-            user.schedule_time = time(hour, minute)
-            await self.session.commit()
-            await self.session.refresh(user)
-        return user
+        return await self._update_returning(telegram_id, schedule_time=time(hour, minute))
 
     async def set_active(self, telegram_id: int, is_active: bool) -> User | None:
-        user = await self.get_by_id(telegram_id)
-        if user:
-            user.is_active = is_active
-            await self.session.commit()
-            await self.session.refresh(user)
-        return user
+        return await self._update_returning(telegram_id, is_active=is_active)
+
+    async def toggle_active(self, telegram_id: int) -> User | None:
+        """Flip is_active atomically in the database and return the updated user."""
+        return await self._update_returning(telegram_id, is_active=not_(User.is_active))
+
+
+class ChannelRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_by_username(self, username: str) -> Channel | None:
+        query = select(Channel).where(Channel.username == username.lstrip("@").lower())
+        result = await self.session.execute(query)
+        return result.scalar_one_or_none()
+
+    async def get_or_create(self, username: str) -> Channel:
+        username = username.lstrip("@").lower()
+        query = (
+            insert(Channel)
+            .values(username=username)
+            .on_conflict_do_update(index_elements=[Channel.username], set_={"username": username})
+            .returning(Channel)
+        )
+        channel = await self.session.scalar(query)
+        await self.session.commit()
+        return channel
 
 
 class DigestLogRepository:
@@ -74,12 +160,14 @@ class DigestLogRepository:
         tokens_used: int = 0,
         status: str = "success",
         error_message: str | None = None,
+        model: str | None = None,
     ) -> DigestLog:
         log = DigestLog(
             user_id=user_id,
             channel=channel,
             items_count=items_count,
             tokens_used=tokens_used,
+            model=model,
             status=status,
             error_message=error_message,
         )
@@ -88,6 +176,15 @@ class DigestLogRepository:
         await self.session.refresh(log)
         return log
 
+    async def create_many(self, records: list[dict]) -> int:
+        """Insert many log rows with a single multi-row INSERT."""
+        if not records:
+            return 0
+
+        await self.session.execute(insert(DigestLog).values(records))
+        await self.session.commit()
+        return len(records)
+
     async def get_user_logs(self, user_id: int, limit: int = 10) -> list[DigestLog]:
         query = (
             select(DigestLog)
@@ -97,3 +194,65 @@ class DigestLogRepository:
         )
         result = await self.session.execute(query)
         return list(result.scalars().all())
+
+
+class PostRepository:
+    # Daily partitions already ensured by this process
+    _known_partitions: set[date] = set()
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def _ensure_partitions(self, days: set[date]) -> set[date]:
+        missing = days - self._known_partitions
+        for day in sorted(missing):
+            await self.session.execute(
+                text("SELECT create_posts_partition(:day)"),
+                {"day": day},
+            )
+        return missing
+
+    async def upsert_many(self, channel: str, posts: list[dict]) -> int:
+        """
+        Store a batch of posts with a single INSERT ... ON CONFLICT.
+
+        Each post dict has message_id, text, link, posted_at (aware UTC),
+        media_group_id and forward_key.
+        """
+        if not posts:
+            return 0
+
+        created = await self._ensure_partitions({p["posted_at"].date() for p in posts})
+
+        query = insert(ChannelPost).values([{"channel": channel, **p} for p in posts])
+        query = query.on_conflict_do_update(
+            index_elements=[ChannelPost.channel, ChannelPost.message_id, ChannelPost.posted_at],
+            set_={
+                "text": query.excluded.text,
+                "link": query.excluded.link,
+                "media_group_id": query.excluded.media_group_id,
+                "forward_key": query.excluded.forward_key,
+            },
+        )
+        await self.session.execute(query)
+        await self.session.commit()
+        self._known_partitions.update(created)
+        return len(posts)
+
+    async def get_recent(self, channel: str, since: datetime) -> list[ChannelPost]:
+        query = (
+            select(ChannelPost)
+            .where(ChannelPost.channel == channel, ChannelPost.posted_at >= since)
+            .order_by(ChannelPost.posted_at.desc())
+        )
+        result = await self.session.execute(query)
+        return list(result.scalars().all())
+
+    async def drop_partitions_before(self, cutoff: date) -> int:
+        result = await self.session.execute(
+            text("SELECT drop_posts_partitions_before(:cutoff)"),
+            {"cutoff": cutoff},
+        )
+        await self.session.commit()
+        PostRepository._known_partitions = {d for d in self._known_partitions if d >= cutoff}
+        return result.scalar_one()
@@ -1,101 +1,329 @@
 import asyncio
-import json
 import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from functools import partial
 
 from openai import AsyncOpenAI, APIError, APITimeoutError, RateLimitError
 
 from lib.core.config import settings
 from lib.core.constants import SYSTEM_PROMPT
+from lib.core.metrics import Counter, Histogram
+from lib.worker.cache import digest_cache
+from lib.worker.circuit_breaker import get_breaker
+from lib.worker.llm_limiter import create_llm_limiter
+from lib.worker.prompt import EncodedPosts, encode_posts, estimate_tokens, restore_links
 from lib.worker.scraper import Post
+from lib.worker.singleflight import single_flight
 
 
 logger = logging.getLogger(__name__)
 
 MAX_RETRIES = 3
-RETRY_DELAY = 2  # seconds
+RETRY_DELAY = 2  # seconds, base of the exponential backoff
+MAX_RETRY_DELAY = 30  # seconds
+
+# Concurrent requests for the same digest wait for the first one's completion
+GENERATION_LOCK_TTL = 300  # seconds, matches the task time limit
+GENERATION_WAIT_TIMEOUT = 240  # seconds, without a caller deadline
+# A manual digest doesn't wait long on a scheduled leader that may itself be
+# queued for a shared limiter slot; it generates through its own limiter
+INTERACTIVE_WAIT_TIMEOUT = 10  # seconds
+
+# Shared by all worker processes; shrinks on 429s, grows while calls are fast
+llm_limiter = create_llm_limiter(overload_errors=(RateLimitError,))
+# Reserved for manual digests, which a user is waiting on
+interactive_llm_limiter = create_llm_limiter(
+    overload_errors=(RateLimitError,),
+    name="openrouter:interactive",
+    max_limit=settings.llm_interactive_concurrency,
+)
+
+PROMPT_TOKENS_SAVED = Counter(
+    "digest_prompt_tokens_saved_total",
+    "Estimated prompt tokens saved by the compact post encoding",
+)
+
+
+LLM_LATENCY = Histogram(
+    "digest_llm_request_seconds",
+    "Latency of one LLM request, including the streamed response",
+    ("model", "outcome"),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 180.0, 300.0),
+)
+LLM_TOKENS = Counter(
+    "digest_llm_tokens_total",
+    "Tokens billed for LLM requests",
+    ("model",),
+)
+LLM_ERRORS = Counter(
+    "digest_llm_errors_total",
+    "Failed LLM attempts that were retried or given up on",
+    ("model", "error"),
+)
+
+
+class CircuitOpenError(Exception):
+    pass
 
 
 def get_openrouter_client() -> AsyncOpenAI:
+    # Retries are ours (_generate_with_model), so every attempt reaches the
+    # breaker and the limiter; SDK retries would multiply requests unseen
     return AsyncOpenAI(
         base_url=settings.openrouter_base_url,
         api_key=settings.openrouter_api_key,
+        max_retries=0,
+        timeout=settings.llm_request_timeout,
     )
 
 
-def _format_posts_for_prompt(posts: list[Post]) -> str:
-    posts_data = [
-        {
-            "id": p.id,
-            "text": p.text[:2000],  # Truncate long posts
-            "link": p.link,
-        }
-        for p in posts
-    ]
-    return json.dumps(posts_data, ensure_ascii=False, indent=2)
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempt - 1)))
+
+
+async def _complete(client: AsyncOpenAI, model: str, messages: list[dict]) -> tuple[str, int]:
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=2000,
+        temperature=0.3,
+    )
+
+    content = response.choices[0].message.content or ""
+    tokens_used = response.usage.total_tokens if response.usage else 0
+    return content, tokens_used
+
+
+async def _complete_stream(
+    client: AsyncOpenAI,
+    model: str,
+    messages: list[dict],
+    on_update: Callable[[str], Awaitable[None]],
+) -> tuple[str, int]:
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=2000,
+        temperature=0.3,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+
+    content = ""
+    tokens_used = 0
+
+    async for chunk in stream:
+        if chunk.usage:
+            tokens_used = chunk.usage.total_tokens
+        if not chunk.choices:
+            continue
+
+        delta = chunk.choices[0].delta.content
+        if delta:
+            content += delta
+            await on_update(content)
+
+    return content, tokens_used
+
+
+def _format_posts_for_prompt(posts: list[Post]) -> EncodedPosts:
+    budget = settings.prompt_token_budget - estimate_tokens(SYSTEM_PROMPT)
+    encoded = encode_posts(posts, budget)
+
+    PROMPT_TOKENS_SAVED.inc(encoded.tokens_saved)
+    logger.info(
+        f"Prompt: {len(encoded.links)}/{len(posts)} posts, ~{encoded.tokens} tokens, "
+        f"~{encoded.tokens_saved} tokens saved vs JSON"
+    )
+    return encoded
+
+
+async def _generate_with_model(
+    client: AsyncOpenAI,
+    model: str,
+    messages: list[dict],
+    on_update: Callable[[str], Awaitable[None]] | None,
+    interactive: bool = False,
+) -> tuple[str, int]:
+    """
+    Call one model with retries, feeding every outcome to its circuit breaker.
+
+    Stops retrying as soon as the breaker opens, so the caller can move on
+    to the next model in the fallback chain. An attempt that ends without a
+    model outcome (no limiter slot, cancellation) gives its half-open trial
+    back instead of holding it forever.
+    """
+    breaker = get_breaker(model, settings.llm_breaker_failures, settings.llm_breaker_cooldown)
+    limiter = interactive_llm_limiter if interactive else llm_limiter
+    last_error: Exception | None = None
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        trial = breaker.state == "half-open"
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit for {model} is open (last error: {last_error})")
+
+        try:
+            async with limiter.slot():
+                started = time.perf_counter()
+                if on_update is None:
+                    result = await _complete(client, model, messages)
+                else:
+                    result = await _complete_stream(client, model, messages, on_update)
+                LLM_LATENCY.observe(time.perf_counter() - started, model=model, outcome="success")
+
+            breaker.record_success()
+            LLM_TOKENS.inc(result[1], model=model)
+            return result
 
+        except RateLimitError as e:
+            logger.warning(f"Rate limit hit on {model} (attempt {attempt}/{MAX_RETRIES}): {e}")
+            LLM_ERRORS.inc(model=model, error="rate_limit")
+            last_error = e
+
+        except APITimeoutError as e:
+            logger.warning(f"API timeout on {model} (attempt {attempt}/{MAX_RETRIES}): {e}")
+            LLM_ERRORS.inc(model=model, error="timeout")
+            last_error = e
+
+        except APIError as e:
+            logger.error(f"API error on {model} (attempt {attempt}/{MAX_RETRIES}): {e}")
+            LLM_ERRORS.inc(model=model, error="api")
+            last_error = e
+
+        except BaseException:
+            if trial:
+                breaker.release_trial()
+            raise
 
-async def generate_digest(posts: list[Post]) -> tuple[str, int]:
+        breaker.record_failure()
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(_backoff(attempt))
+
+    raise Exception(f"{model} failed after {MAX_RETRIES} attempts: {last_error}")
+
+
+async def generate_digest(
+    posts: list[Post],
+    channel: str,
+    on_update: Callable[[str], Awaitable[None]] | None = None,
+    interactive: bool = False,
+    timeout: float | None = None,
+) -> tuple[str, int, str | None]:
     """
     Generate a news digest from posts using OpenRouter AI.
 
+    Identical post sets of the same channel are served from the digest cache
+    without calling the model, and concurrent requests for one post set
+    share a single completion. Models are tried in order: openrouter_model,
+    then openrouter_fallback_models; a model whose circuit breaker is open
+    is skipped without a request.
+
     Args:
         posts: List of Post objects to summarize
+        channel: Channel username the posts come from
+        on_update: If given, the completion is streamed and this callback
+            receives the accumulated text after every received chunk
+        interactive: A user is waiting for this digest; calls take slots of
+            the reserved interactive limiter instead of the shared one
+        timeout: Seconds the whole generation may take. A caller waiting on
+            a concurrent generation gives up after half of it (interactive
+            callers after INTERACTIVE_WAIT_TIMEOUT), so it still has time to
+            generate on its own
 
     Returns:
-        Tuple of (digest_text, tokens_used)
+        Tuple of (digest_text, tokens_used, model that served it or None)
 
     Raises:
-        Exception if all retries fail
+        asyncio.TimeoutError if `timeout` runs out
+        Exception if every model fails
     """
+    wait_timeout = GENERATION_WAIT_TIMEOUT if timeout is None else timeout / 2
+    if interactive:
+        wait_timeout = min(wait_timeout, INTERACTIVE_WAIT_TIMEOUT)
+
+    if timeout is None:
+        return await _generate(posts, channel, on_update, interactive, wait_timeout)
+
+    return await asyncio.wait_for(
+        _generate(posts, channel, on_update, interactive, wait_timeout),
+        timeout=timeout,
+    )
+
+
+async def _generate(
+    posts: list[Post],
+    channel: str,
+    on_update: Callable[[str], Awaitable[None]] | None,
+    interactive: bool,
+    wait_timeout: float,
+) -> tuple[str, int, str | None]:
     if not posts:
-        return "За последние 24 часа важных новостей не было.", 0
+        return "За последние 24 часа важных новостей не было.", 0, None
 
-    client = get_openrouter_client()
-    posts_json = _format_posts_for_prompt(posts)
+    cache_key = digest_cache.key(channel, settings.openrouter_model, posts)
+    cached = await digest_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Digest cache hit for {channel}: {cached[1]} tokens saved")
+        return cached
 
-    user_message = f"Вот посты из канала за последние 24 часа:\n\n{posts_json}"
+    return await single_flight(
+        cache_key,
+        partial(_generate_uncached, posts, cache_key, on_update, interactive),
+        partial(digest_cache.peek, cache_key),
+        lock_ttl=GENERATION_LOCK_TTL,
+        wait_timeout=wait_timeout,
+    )
 
-    last_error: Exception | None = None
 
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            response = await client.chat.completions.create(
-                model=settings.openrouter_model,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_message},
-                ],
-                max_tokens=2000,
-                temperature=0.3,
-            )
+async def _generate_uncached(
+    posts: list[Post],
+    cache_key: str,
+    on_update: Callable[[str], Awaitable[None]] | None,
+    interactive: bool,
+) -> tuple[str, int, str | None]:
+    client = get_openrouter_client()
+    encoded = _format_posts_for_prompt(posts)
 
-            content = response.choices[0].message.content or ""
-            tokens_used = response.usage.total_tokens if response.usage else 0
+    user_message = f"Вот посты из канала за последние 24 часа:\n\n{encoded.text}"
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_message},
+    ]
 
-            logger.info(f"AI response received: {len(content)} chars, {tokens_used} tokens")
+    async def emit_update(text: str) -> None:
+        # Streamed text still carries short post ids
+        await on_update(restore_links(text, encoded.links))
 
-            if not content.strip():
-                logger.warning("AI returned empty content, using fallback")
-                return "Не удалось сгенерировать дайджест. Попробуйте позже.", tokens_used
+    errors: list[str] = []
 
-            return content, tokens_used
+    for model in [settings.openrouter_model, *settings.openrouter_fallback_models]:
+        try:
+            content, tokens_used = await _generate_with_model(
+                client,
+                model,
+                messages,
+                emit_update if on_update is not None else None,
+                interactive,
+            )
+        except Exception as e:
+            logger.warning(f"Model {model} unavailable, trying next: {e}")
+            errors.append(str(e))
+            continue
 
-        except RateLimitError as e:
-            logger.warning(f"Rate limit hit (attempt {attempt}/{MAX_RETRIES}): {e}")
-            last_error = e
-            if attempt < MAX_RETRIES:
-                await asyncio.sleep(RETRY_DELAY * attempt)
+        logger.info(f"AI response received from {model}: {len(content)} chars, {tokens_used} tokens")
+        content = restore_links(content, encoded.links)
 
-        except APITimeoutError as e:
-            logger.warning(f"API timeout (attempt {attempt}/{MAX_RETRIES}): {e}")
-            last_error = e
-            if attempt < MAX_RETRIES:
-                await asyncio.sleep(RETRY_DELAY)
+        if not content.strip():
+            logger.warning("AI returned empty content, using fallback")
+            return "Не удалось сгенерировать дайджест. Попробуйте позже.", tokens_used, model
 
-        except APIError as e:
-            logger.error(f"API error (attempt {attempt}/{MAX_RETRIES}): {e}")
-            last_error = e
-            if attempt < MAX_RETRIES:
-                await asyncio.sleep(RETRY_DELAY)
+        # The key names the primary model; a fallback's digest must not pass
+        # for the primary's for the whole cache TTL
+        ttl = None if model == settings.openrouter_model else settings.digest_fallback_cache_ttl
+        await digest_cache.set(cache_key, content, tokens_used, model, ttl=ttl)
+        return content, tokens_used, model
 
-    raise Exception(f"Failed to generate digest after {MAX_RETRIES} attempts: {last_error}")
+    raise Exception(f"Failed to generate digest with all models: {'; '.join(errors)}")
@@ -0,0 +1,232 @@
+"""Redis-backed caches shared by all worker processes."""
+
+import hashlib
+import json
+import logging
+import time
+import zlib
+from collections.abc import Awaitable, Callable
+
+from lib.core.config import settings
+from lib.core.constants import PROMPT_VERSION
+from lib.core.redis import get_redis
+from lib.worker.history import get_recent_posts
+from lib.worker.scraper import Post
+from lib.worker.singleflight import single_flight
+
+
+logger = logging.getLogger(__name__)
+
+FETCH_LOCK_TTL = 120  # seconds
+FETCH_WAIT_TIMEOUT = 90  # seconds
+
+
+def _serialize_posts(posts: list[Post]) -> bytes:
+    data = [p.to_dict() for p in posts]
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def _deserialize_posts(payload: bytes) -> list[Post]:
+    data = json.loads(zlib.decompress(payload).decode("utf-8"))
+    return [Post.from_dict(item) for item in data]
+
+
+class PostCache:
+    """
+    Channel-keyed cache of scraped posts.
+
+    Every user of a channel within the same TTL window reuses one fetch.
+    Entries are zlib-compressed, expire after `ttl` seconds, and the least
+    recently stored ones are evicted once more than `max_entries` are cached.
+    """
+
+    def __init__(
+        self,
+        ttl: int,
+        max_entries: int,
+        max_bytes: int,
+        prefix: str = "digest:posts",
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+
+    def _key(self, channel: str, hours: int) -> str:
+        return f"{self.prefix}:{channel.lower()}:{hours}"
+
+    @property
+    def _index_key(self) -> str:
+        return f"{self.prefix}:index"
+
+    @property
+    def _stats_key(self) -> str:
+        return f"{self.prefix}:stats"
+
+    async def get(self, channel: str, hours: int) -> list[Post] | None:
+        redis = get_redis()
+        payload = await redis.get(self._key(channel, hours))
+
+        if payload is None:
+            await redis.hincrby(self._stats_key, "misses", 1)
+            return None
+
+        await redis.hincrby(self._stats_key, "hits", 1)
+        return _deserialize_posts(payload)
+
+    async def set(self, channel: str, hours: int, posts: list[Post]) -> None:
+        payload = _serialize_posts(posts)
+        if len(payload) > self.max_bytes:
+            logger.warning(
+                f"Not caching posts for {channel}: {len(payload)} bytes exceeds {self.max_bytes}"
+            )
+            return
+
+        redis = get_redis()
+        key = self._key(channel, hours)
+        now = time.time()
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, payload, ex=self.ttl)
+            pipe.zadd(self._index_key, {key: now})
+            pipe.zremrangebyscore(self._index_key, "-inf", now - self.ttl)
+            pipe.zcard(self._index_key)
+            *_, size = await pipe.execute()
+
+        if size > self.max_entries:
+            evicted = await redis.zpopmin(self._index_key, size - self.max_entries)
+            if evicted:
+                await redis.delete(*(k for k, _ in evicted))
+                logger.info(f"Post cache evicted {len(evicted)} entries")
+
+    async def get_or_fetch(
+        self,
+        channel: str,
+        hours: int,
+        fetch: Callable[[], Awaitable[list[Post]]],
+    ) -> list[Post]:
+        """
+        Return cached posts or fetch them once for all concurrent callers.
+
+        Only one caller per channel runs `fetch`; others wait for its result
+        and fall back to fetching themselves if it does not show up in time.
+        """
+        posts = await self.get(channel, hours)
+        if posts is not None:
+            logger.info(f"Post cache hit for {channel}: {len(posts)} posts")
+            return posts
+
+        async def fetch_and_store() -> list[Post]:
+            fetched = await fetch()
+            await self.set(channel, hours, fetched)
+            return fetched
+
+        async def load() -> list[Post] | None:
+            payload = await get_redis().get(self._key(channel, hours))
+            return _deserialize_posts(payload) if payload is not None else None
+
+        return await single_flight(
+            self._key(channel, hours),
+            fetch_and_store,
+            load,
+            lock_ttl=FETCH_LOCK_TTL,
+            wait_timeout=FETCH_WAIT_TIMEOUT,
+        )
+
+    async def stats(self) -> dict[str, int]:
+        redis = get_redis()
+        raw = await redis.hgetall(self._stats_key)
+        stats = {k.decode(): int(v) for k, v in raw.items()}
+        stats.setdefault("hits", 0)
+        stats.setdefault("misses", 0)
+        stats["entries"] = await redis.zcard(self._index_key)
+        return stats
+
+
+post_cache = PostCache(
+    ttl=settings.post_cache_ttl,
+    max_entries=settings.post_cache_max_entries,
+    max_bytes=settings.post_cache_max_bytes,
+)
+
+
+async def get_channel_posts(channel: str, hours: int = 24) -> list[Post]:
+    """Fetch channel posts through the shared post cache."""
+    channel = channel.lstrip("@")
+    return await post_cache.get_or_fetch(
+        channel,
+        hours,
+        lambda: get_recent_posts(channel, hours=hours),
+    )
+
+
+class DigestCache:
+    """
+    Content-addressed cache of generated digests.
+
+    The key covers the channel, model, prompt version and a hash of the post
+    ids and texts, so any user whose posts are identical reuses the stored
+    digest, its original token count and the model that served it instead of
+    calling the LLM again.
+    """
+
+    def __init__(self, ttl: int, prefix: str = "digest:llm"):
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @staticmethod
+    def _posts_hash(posts: list[Post]) -> str:
+        digest = hashlib.sha256()
+        for p in posts:
+            digest.update(str(p.id).encode())
+            digest.update(b"\0")
+            digest.update(p.text.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def key(self, channel: str, model: str, posts: list[Post]) -> str:
+        return (
+            f"{self.prefix}:{channel.lower()}:{model}:{PROMPT_VERSION}:"
+            f"{self._posts_hash(posts)}"
+        )
+
+    async def get(self, key: str) -> tuple[str, int, str | None] | None:
+        cached = await self.peek(key)
+        field = "misses" if cached is None else "hits"
+        await get_redis().hincrby(f"{self.prefix}:stats", field, 1)
+        return cached
+
+    async def peek(self, key: str) -> tuple[str, int, str | None] | None:
+        """Read an entry without counting a hit or miss."""
+        payload = await get_redis().get(key)
+        if payload is None:
+            return None
+
+        data = json.loads(zlib.decompress(payload).decode("utf-8"))
+        return data["text"], data["tokens_used"], data.get("model")
+
+    async def set(
+        self,
+        key: str,
+        text: str,
+        tokens_used: int,
+        model: str | None = None,
+        ttl: int | None = None,
+    ) -> None:
+        payload = zlib.compress(
+            json.dumps(
+                {"text": text, "tokens_used": tokens_used, "model": model},
+                ensure_ascii=False,
+            ).encode("utf-8")
+        )
+        await get_redis().set(key, payload, ex=ttl or self.ttl)
+
+    async def stats(self) -> dict[str, int]:
+        raw = await get_redis().hgetall(f"{self.prefix}:stats")
+        stats = {k.decode(): int(v) for k, v in raw.items()}
+        stats.setdefault("hits", 0)
+        stats.setdefault("misses", 0)
+        return stats
+
+
+digest_cache = DigestCache(ttl=settings.digest_cache_ttl)
@@ -1,12 +1,30 @@
 import asyncio
+import logging
 
+from billiard import current_process
 from celery import Celery
+from kombu import Queue
 from celery.schedules import crontab
-from celery.signals import worker_process_init
+from celery.signals import (
+    after_setup_logger,
+    after_setup_task_logger,
+    task_postrun,
+    task_prerun,
+    worker_process_init,
+    worker_process_shutdown,
+)
 
 from lib.core.config import settings
 
 
+logger = logging.getLogger(__name__)
+
+# Manual /digest and channel checks, which a user is waiting on. Served by a
+# worker of its own so the hourly fan-out never delays them.
+INTERACTIVE_QUEUE = "interactive"
+# Scheduled fan-out and maintenance
+BULK_QUEUE = "bulk"
+
 app = Celery(
     "digest_worker",
     broker=settings.redis_url,
@@ -23,6 +41,23 @@ app.conf.update(
     task_track_started=True,
     task_time_limit=300,
     worker_prefetch_multiplier=1,
+    # A worker started without -Q consumes every queue (local development)
+    task_queues=(Queue(INTERACTIVE_QUEUE), Queue(BULK_QUEUE), Queue("celery")),
+    task_routes={
+        "lib.worker.tasks.generate_digest_task": {"queue": INTERACTIVE_QUEUE},
+        "lib.worker.tasks.resolve_channel_task": {"queue": INTERACTIVE_QUEUE},
+        "lib.worker.tasks.scheduled_digest_task": {"queue": BULK_QUEUE},
+        "lib.worker.tasks.prepare_channel_digest_task": {"queue": BULK_QUEUE},
+        "lib.worker.tasks.dispatch_deliveries_task": {"queue": BULK_QUEUE},
+        "lib.worker.tasks.deliver_digest_task": {"queue": BULK_QUEUE},
+        "lib.worker.tasks.prune_posts_task": {"queue": BULK_QUEUE},
+    },
+    # %(trace_id)s is filled in by TraceIdFilter (see setup_trace_logging)
+    worker_log_format="[%(asctime)s: %(levelname)s/%(processName)s] [%(trace_id)s] %(message)s",
+    worker_task_log_format=(
+        "[%(asctime)s: %(levelname)s/%(processName)s] [%(trace_id)s] "
+        "%(task_name)s[%(task_id)s]: %(message)s"
+    ),
 )
 
 app.conf.beat_schedule = {
@@ -30,14 +65,87 @@ app.conf.beat_schedule = {
         "task": "lib.worker.tasks.scheduled_digest_task",
         "schedule": crontab(minute=0),
     },
+    "daily-posts-retention": {
+        "task": "lib.worker.tasks.prune_posts_task",
+        "schedule": crontab(hour=3, minute=30),
+    },
 }
 
 
+@after_setup_logger.connect
+@after_setup_task_logger.connect
+def setup_trace_logging(logger, **kwargs):
+    from lib.core.tracing import install_trace_filter
+
+    install_trace_filter(logger)
+
+
+@task_prerun.connect
+def start_task_profile(task_id=None, task=None, **kwargs):
+    from lib.worker.profiling import task_profiler
+
+    if task_profiler.enabled:
+        task_profiler.start(task_id, task.name)
+
+
+@task_postrun.connect
+def stop_task_profile(task_id=None, task=None, kwargs=None, **extra):
+    from lib.worker.profiling import task_profiler
+
+    if task_profiler.enabled:
+        task_profiler.stop(task_id, task.name, (kwargs or {}).get("trace_id"))
+
+
+@task_postrun.connect
+def flush_digest_logs(**kwargs):
+    """
+    Write the digest log records buffered by the finished task.
+
+    Runs after every task, failed ones included, since nothing else would
+    flush the buffer while the worker waits for its next task.
+    """
+    from lib.worker.log_sink import digest_log_sink
+
+    asyncio.get_event_loop().run_until_complete(digest_log_sink.flush())
+
+
 @worker_process_init.connect
 def init_worker_process(**kwargs):
     """
     Create a single event loop for each worker process.
     This loop will be reused for all async tasks in this process.
+
+    Nothing slow may run here: this is billiard's after-fork initializer, and
+    a child that doesn't report ready within worker_proc_alive_timeout is
+    killed and respawned. The Pyrogram client is started by the first task
+    that needs it and then reused. Each pool process serves its own metrics
+    on worker_metrics_port + its pool index.
     """
+    from lib.core.metrics import start_metrics_server
+
+    if settings.metrics_enabled:
+        start_metrics_server(settings.worker_metrics_port + (current_process().index or 0))
+
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """
+    Drain buffered digest logs and disconnect the Pyrogram and Bot API
+    clients cleanly before the process exits.
+    """
+    from lib.worker.delivery import sender
+    from lib.worker.log_sink import digest_log_sink
+    from lib.worker.scraper import stop_client
+
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(digest_log_sink.close())
+        loop.run_until_complete(stop_client())
+        loop.run_until_complete(sender.close())
+    except Exception as e:
+        logger.exception(f"Failed to stop clients: {e}")
+    finally:
+        loop.close()
@@ -0,0 +1,147 @@
+"""Local pre-pass that coalesces albums, forwards and near-duplicate posts."""
+
+import hashlib
+import logging
+import re
+from collections import defaultdict
+
+from lib.worker.scraper import Post
+
+
+logger = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+# Posts whose fingerprints differ in at most this many bits are duplicates
+MAX_HAMMING_DISTANCE = 3
+# Split fingerprints into MAX_HAMMING_DISTANCE + 1 bands: near-duplicates
+# always share at least one band exactly, so only those pairs are compared
+_BANDS = MAX_HAMMING_DISTANCE + 1
+_BAND_BITS = SIMHASH_BITS // _BANDS
+SHINGLE_SIZE = 3
+# Shorter texts are only merged when they are identical after normalization
+MIN_SIMHASH_WORDS = 8
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(words: list[str]) -> int:
+    """64-bit SimHash over word shingles."""
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [
+            " ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)
+        ]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+class _Clusters:
+    """Union-find over post indexes."""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _merge_cluster(posts: list[Post]) -> Post:
+    """Keep the richest post as the link target, folding in distinct album captions."""
+    richest = max(posts, key=lambda p: len(p.text))
+    text = richest.text
+
+    for post in posts:
+        if post is richest or post.media_group_id is None:
+            continue
+        if post.media_group_id == richest.media_group_id and post.text.strip() not in text:
+            text = f"{text}\n{post.text}"
+
+    if text == richest.text:
+        return richest
+
+    return Post(
+        id=richest.id,
+        text=text,
+        link=richest.link,
+        date=richest.date,
+        media_group_id=richest.media_group_id,
+        forward_key=richest.forward_key,
+    )
+
+
+def coalesce_posts(posts: list[Post]) -> list[Post]:
+    """
+    Merge albums, forwarded copies and near-duplicates into one post each.
+
+    Posts of one media group and forwards of the same original are merged
+    outright; the remaining ones are clustered by SimHash of their word
+    shingles. The original order (by each cluster's first post) is kept.
+    """
+    if len(posts) < 2:
+        return posts
+
+    clusters = _Clusters(len(posts))
+    first_by_key: dict[str, int] = {}
+    bands: dict[tuple[int, int], list[int]] = defaultdict(list)
+    fingerprints: dict[int, int] = {}
+
+    for i, post in enumerate(posts):
+        keys = []
+        if post.media_group_id:
+            keys.append(f"album:{post.media_group_id}")
+        if post.forward_key:
+            keys.append(f"forward:{post.forward_key}")
+
+        words = _words(post.text)
+        if len(words) >= MIN_SIMHASH_WORDS:
+            fingerprint = simhash(words)
+            fingerprints[i] = fingerprint
+            for band in range(_BANDS):
+                value = fingerprint >> (band * _BAND_BITS) & ((1 << _BAND_BITS) - 1)
+                for j in bands[(band, value)]:
+                    if bin(fingerprint ^ fingerprints[j]).count("1") <= MAX_HAMMING_DISTANCE:
+                        clusters.union(i, j)
+                bands[(band, value)].append(i)
+        elif words:
+            keys.append("text:" + " ".join(words))
+        # Posts without words (emoji, media-only captions) get no text key,
+        # otherwise they would all merge under the same empty one
+
+        for key in keys:
+            if key in first_by_key:
+                clusters.union(i, first_by_key[key])
+            else:
+                first_by_key[key] = i
+
+    grouped: dict[int, list[Post]] = defaultdict(list)
+    for i, post in enumerate(posts):
+        grouped[clusters.find(i)].append(post)
+
+    result = [_merge_cluster(group) for _, group in sorted(grouped.items())]
+
+    if len(result) < len(posts):
+        logger.info(f"Coalesced {len(posts)} posts into {len(result)}")
+    return result
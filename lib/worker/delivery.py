@@ -0,0 +1,356 @@
+"""Rate-limited Telegram Bot API client shared by all tasks of a worker process."""
+
+import asyncio
+import logging
+import time
+
+import httpx
+
+from lib.core.config import settings
+from lib.core.metrics import Counter, Histogram
+from lib.core.redis import get_redis
+from lib.worker.formatting import html_to_text, sanitize_telegram_html, split_telegram_html
+
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+
+SEND_LATENCY = Histogram(
+    "digest_telegram_send_seconds",
+    "Bot API request latency",
+    ("method",),
+)
+QUEUE_WAIT = Histogram(
+    "digest_telegram_queue_wait_seconds",
+    "Time a Bot API request waited for the rate limiters",
+    ("method",),
+)
+SANITIZE_LATENCY = Histogram(
+    "digest_sanitize_seconds",
+    "Time to sanitize and split a digest into Telegram messages",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+RATE_LIMITED = Counter(
+    "digest_telegram_rate_limited_total",
+    "Bot API 429 responses",
+    ("method",),
+)
+
+
+# Refill the bucket by elapsed time and take a token if there is one.
+# Uses the Redis clock, so workers on different hosts agree on elapsed time.
+# KEYS: bucket hash. ARGV: rate, capacity.
+# Returns "0" if a token was taken, else the seconds until the next one.
+_TAKE_TOKEN_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket shared through Redis: `rate` requests per second with
+    bursts up to `capacity`, across every process that uses the same key.
+    """
+
+    def __init__(self, key: str, rate: float, capacity: float | None = None):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # The lock keeps this process's waiters in FIFO order
+        async with self._lock:
+            while True:
+                wait = float(
+                    await get_redis().eval(_TAKE_TOKEN_SCRIPT, 1, self.key, self.rate, self.capacity)
+                )
+                if wait <= 0:
+                    return
+
+                await asyncio.sleep(wait)
+
+
+class PerChatLimiter:
+    """Spaces requests to the same chat at least `interval` seconds apart."""
+
+    MAX_TRACKED_CHATS = 10_000
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_slot: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, 0.0))
+        self._next_slot[chat_id] = slot + self.interval
+
+        if len(self._next_slot) > self.MAX_TRACKED_CHATS:
+            self._prune(now)
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def defer(self, chat_id: int, seconds: float) -> None:
+        """Push the next slot of a chat back, e.g. after a 429 retry_after."""
+        self._next_slot[chat_id] = max(
+            self._next_slot.get(chat_id, 0.0),
+            time.monotonic() + seconds,
+        )
+
+    def _prune(self, now: float) -> None:
+        self._next_slot = {k: v for k, v in self._next_slot.items() if v > now}
+
+
+class TelegramSender:
+    """
+    Keep-alive Bot API client with global and per-chat rate limiting.
+
+    429 responses are retried after the `retry_after` Telegram asks for.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        api_url: str,
+        global_rate: float,
+        chat_interval: float,
+    ):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self._bucket = TokenBucket("digest:telegram:bucket", global_rate)
+        self._chat_limiter = PerChatLimiter(chat_interval)
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=30,
+                limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60),
+            )
+        return self._client
+
+    async def call(self, method: str, chat_id: int, payload: dict) -> httpx.Response:
+        """Call a Bot API method for a chat, honouring the rate limits."""
+        response: httpx.Response | None = None
+
+        for attempt in range(1, MAX_RETRIES + 1):
+            queued_at = time.perf_counter()
+            await self._chat_limiter.wait(chat_id)
+            await self._bucket.acquire()
+            QUEUE_WAIT.observe(time.perf_counter() - queued_at, method=method)
+
+            with SEND_LATENCY.time(method=method):
+                response = await self.client.post(f"{self.base_url}/{method}", json=payload)
+
+            if response.status_code != 429:
+                return response
+
+            RATE_LIMITED.inc(method=method)
+            retry_after = _retry_after(response)
+            logger.warning(
+                f"Telegram rate limit for chat {chat_id} (attempt {attempt}/{MAX_RETRIES}), "
+                f"retry after {retry_after}s"
+            )
+            self._chat_limiter.defer(chat_id, retry_after)
+
+        return response
+
+    async def send_message(
+        self,
+        chat_id: int,
+        text: str,
+        parse_mode: str | None = None,
+    ) -> httpx.Response:
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "disable_web_page_preview": True,
+        }
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        return await self.call("sendMessage", chat_id, payload)
+
+    async def edit_message_text(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        parse_mode: str | None = None,
+    ) -> httpx.Response:
+        payload = {
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "text": text,
+            "disable_web_page_preview": True,
+        }
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        return await self.call("editMessageText", chat_id, payload)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _is_parse_error(response: httpx.Response) -> bool:
+    """Whether Telegram rejected the message markup ("can't parse entities")."""
+    if response.status_code != 400:
+        return False
+    try:
+        description = response.json()["description"]
+    except (ValueError, KeyError, TypeError):
+        return False
+    return "can't parse" in description.lower()
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return 1.0
+
+
+sender = TelegramSender(
+    token=settings.bot_token,
+    api_url=settings.telegram_api_url,
+    global_rate=settings.telegram_global_rate,
+    chat_interval=settings.telegram_chat_interval,
+)
+
+
+async def _send_chunk(chat_id: int, chunk: str, edit_message_id: int | None) -> bool:
+    if edit_message_id is not None:
+        response = await sender.edit_message_text(chat_id, edit_message_id, chunk, parse_mode="HTML")
+    else:
+        response = await sender.send_message(chat_id, chunk, parse_mode="HTML")
+
+    if response.status_code == 200:
+        return True
+
+    # Log the error
+    logger.error(f"Telegram API error (HTML): {response.status_code} - {response.text}")
+
+    # Rate limits and server errors would fail the same way as plain text
+    if not _is_parse_error(response):
+        return False
+
+    # Fallback: send this part without HTML parsing (plain text)
+    plain = html_to_text(chunk)
+    if edit_message_id is not None:
+        response = await sender.edit_message_text(chat_id, edit_message_id, plain)
+    else:
+        response = await sender.send_message(chat_id, plain)
+
+    if response.status_code != 200:
+        logger.error(f"Telegram API error (plain): {response.status_code} - {response.text}")
+        return False
+
+    logger.info("Message part sent successfully with plain text fallback")
+    return True
+
+
+async def send_html_message(chat_id: int, text: str, edit_message_id: int | None = None) -> bool:
+    """
+    Send model output as one or more HTML messages.
+
+    Long texts are split into several valid HTML messages at item boundaries.
+    If `edit_message_id` is given, the first part replaces that message.
+    """
+    with SANITIZE_LATENCY.time():
+        sanitized_text = sanitize_telegram_html(text)
+        chunks = split_telegram_html(sanitized_text)
+
+    # Check if text is empty after sanitization
+    if not html_to_text(sanitized_text).strip():
+        logger.error("Message is empty after sanitization, original text was: %s", text[:500])
+        return False
+
+    if len(chunks) > 1:
+        logger.info(f"Message split into {len(chunks)} parts for chat {chat_id}")
+
+    for i, chunk in enumerate(chunks):
+        if not await _send_chunk(chat_id, chunk, edit_message_id if i == 0 else None):
+            return False
+
+    return True
+
+
+class LiveMessage:
+    """
+    A placeholder message edited in place while a digest is streamed.
+
+    Edits happen at most every `interval` seconds and only once another
+    section (blank-line separated) of the text is complete, so partial tags
+    are never shown. The final text is delivered by `finish`.
+    """
+
+    def __init__(self, chat_id: int, message_id: int | None = None, interval: float | None = None):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval if interval is not None else settings.stream_edit_interval
+        self._shown = 0
+        self._last_edit = 0.0
+        self._pending: asyncio.Task | None = None
+
+    async def start(self, text: str) -> None:
+        """Post the placeholder unless the bot already did."""
+        if self.message_id is not None:
+            return
+
+        response = await sender.send_message(self.chat_id, text)
+        if response.status_code == 200:
+            self.message_id = response.json()["result"]["message_id"]
+
+    async def update(self, text: str) -> None:
+        if self.message_id is None:
+            return
+
+        boundary = text.rfind("\n\n")
+        if boundary <= self._shown:
+            return
+        if time.monotonic() - self._last_edit < self.interval:
+            return
+        if self._pending is not None and not self._pending.done():
+            return
+
+        self._shown = boundary
+        self._last_edit = time.monotonic()
+        # Don't hold up the stream while Telegram answers
+        self._pending = asyncio.create_task(self._edit(text[:boundary] + "\n\n…"))
+
+    async def _edit(self, text: str) -> None:
+        chunk = split_telegram_html(sanitize_telegram_html(text))[0]
+        try:
+            response = await sender.edit_message_text(
+                self.chat_id, self.message_id, chunk, parse_mode="HTML"
+            )
+            if response.status_code != 200:
+                logger.warning(f"Live edit failed: {response.status_code} - {response.text}")
+        except Exception as e:
+            logger.warning(f"Live edit failed for chat {self.chat_id}: {e}")
+
+    async def finish(self, text: str) -> bool:
+        """Replace the placeholder with the final text."""
+        if self._pending is not None:
+            await self._pending
+
+        return await send_html_message(self.chat_id, text, edit_message_id=self.message_id)
@@ -0,0 +1,183 @@
+"""Telegram HTML sanitizing and splitting of long digests into several messages."""
+
+import html
+import re
+
+
+# Telegram message limit is 4096 characters
+MAX_MESSAGE_LENGTH = 4096
+
+# Room kept in every chunk for closing and re-opening tags split across messages
+_TAG_RESERVE = 512
+
+ALLOWED_TAGS = ("b", "i", "a")
+
+# One token per match: an allowed tag, an entity Telegram understands, or a
+# stray special character that has to be escaped. Everything between
+# matches is plain text.
+_TOKEN_RE = re.compile(
+    r"<(?P<close>/?)(?P<tag>b|i|a)(?P<attrs>(?:\s[^<>]*)?)>"
+    r"|(?P<entity>&(?:lt|gt|amp|quot|#\d+|#x[0-9a-fA-F]+);)"
+    r"|(?P<special>[<>&])",
+    re.IGNORECASE,
+)
+_HREF_RE = re.compile(r"""href\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+_TAG_RE = re.compile(r"<(/?)(b|i|a)\b[^<>]*>")
+
+_SPECIAL_ESCAPES = {"<": "&lt;", ">": "&gt;", "&": "&amp;"}
+
+
+def sanitize_telegram_html(text: str) -> str:
+    """
+    Sanitize model output for Telegram's HTML parse mode in a single pass.
+
+    Only <b>, <i> and <a href="..."> survive; any other markup and stray
+    <, > or & are escaped. Tags are balanced: unmatched closing tags are
+    dropped, crossed tags are re-nested and unclosed ones closed at the end.
+    """
+    out: list[str] = []
+    stack: list[tuple[str, str]] = []  # (tag name, opening tag)
+    pos = 0
+
+    for match in _TOKEN_RE.finditer(text):
+        out.append(text[pos:match.start()])
+        pos = match.end()
+
+        if match.group("entity"):
+            out.append(match.group("entity"))
+            continue
+
+        if match.group("special"):
+            out.append(_SPECIAL_ESCAPES[match.group("special")])
+            continue
+
+        tag = match.group("tag").lower()
+
+        if match.group("close"):
+            if all(name != tag for name, _ in stack):
+                continue
+            # Close everything opened after the matching tag, then re-open it
+            reopen = []
+            while stack:
+                name, opening = stack.pop()
+                out.append(f"</{name}>")
+                if name == tag:
+                    break
+                reopen.append((name, opening))
+            for name, opening in reversed(reopen):
+                out.append(opening)
+                stack.append((name, opening))
+            continue
+
+        if tag == "a":
+            href = _HREF_RE.search(match.group("attrs") or "")
+            # Links can't be nested and need an href
+            if href is None or any(name == "a" for name, _ in stack):
+                continue
+            url = html.escape(html.unescape(href.group(1) or href.group(2) or ""), quote=True)
+            opening = f'<a href="{url}">'
+        else:
+            opening = f"<{tag}>"
+
+        out.append(opening)
+        stack.append((tag, opening))
+
+    out.append(text[pos:])
+    out.extend(f"</{name}>" for name, _ in reversed(stack))
+    return "".join(out)
+
+
+def html_to_text(text: str) -> str:
+    """Strip tags and entities from sanitized HTML for a plain-text fallback."""
+    return html.unescape(_TAG_RE.sub("", text))
+
+
+def _open_tags(text: str) -> list[str]:
+    """Return the opening tags still unclosed at the end of sanitized HTML."""
+    stack: list[str] = []
+    for match in _TAG_RE.finditer(text):
+        if match.group(1):
+            if stack:
+                stack.pop()
+        else:
+            stack.append(match.group(0))
+    return stack
+
+
+def _closing_tags(opened: list[str]) -> str:
+    return "".join(f"</{_TAG_RE.match(tag).group(2)}>" for tag in reversed(opened))
+
+
+def _hard_split(text: str, limit: int) -> list[str]:
+    """Cut text into pieces of at most `limit` chars, never inside a tag or entity."""
+    pieces = []
+    while len(text) > limit:
+        cut = limit
+        head = text[:cut]
+        if head.rfind("<") > head.rfind(">"):
+            cut = head.rfind("<")
+        elif head.rfind("&") > head.rfind(";"):
+            cut = head.rfind("&")
+        if cut <= 0:
+            cut = limit
+        pieces.append(text[:cut])
+        text = text[cut:]
+    pieces.append(text)
+    return pieces
+
+
+def _pieces(text: str, limit: int, separators: tuple[str, ...]) -> list[str]:
+    """Split text at the coarsest separator that gets every piece under `limit`."""
+    if len(text) <= limit:
+        return [text]
+    if not separators:
+        return _hard_split(text, limit)
+
+    sep, rest = separators[0], separators[1:]
+    parts = text.split(sep)
+    pieces = []
+    for i, part in enumerate(parts):
+        suffix = sep if i < len(parts) - 1 else ""
+        pieces.extend(_pieces(part + suffix, limit, rest))
+    return pieces
+
+
+def split_telegram_html(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """
+    Split sanitized HTML into messages of at most `limit` characters.
+
+    Messages are cut between digest items (blank lines) where possible,
+    then at line breaks and spaces. Tags open at a cut are closed at the end
+    of one message and re-opened at the start of the next, so every message
+    is valid HTML on its own.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    piece_limit = max(limit - _TAG_RESERVE, 1)
+    paragraphs = text.split("\n\n")
+    pieces = []
+    for i, paragraph in enumerate(paragraphs):
+        suffix = "\n\n" if i < len(paragraphs) - 1 else ""
+        pieces.extend(_pieces(paragraph + suffix, piece_limit, ("\n", " ")))
+
+    messages = []
+    prefix = ""
+    current = ""
+
+    for piece in pieces:
+        candidate = prefix + current + piece
+        if current and len(candidate) + len(_closing_tags(_open_tags(candidate))) > limit:
+            body = prefix + current
+            opened = _open_tags(body)
+            messages.append(body.rstrip() + _closing_tags(opened))
+            prefix = "".join(opened)
+            current = piece.lstrip()
+        else:
+            current += piece
+
+    if current.strip():
+        body = prefix + current
+        messages.append(body.rstrip() + _closing_tags(_open_tags(body)))
+
+    return [m for m in messages if html_to_text(m).strip()]
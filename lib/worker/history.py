@@ -0,0 +1,128 @@
+"""Incremental channel history with persisted per-channel message-id cursors."""
+
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from lib.core.config import settings
+from lib.core.metrics import Histogram
+from lib.core.redis import get_redis
+from lib.db.database import async_session_maker
+from lib.db.models import ChannelPost
+from lib.db.repositories import PostRepository
+from lib.worker.scraper import Post, fetch_new_posts
+
+
+logger = logging.getLogger(__name__)
+
+SCRAPE_LATENCY = Histogram(
+    "digest_scrape_seconds",
+    "Time to sync one channel from MTProto into the posts table",
+)
+POSTS_FETCHED = Histogram(
+    "digest_scrape_posts",
+    "New posts fetched by one channel sync",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+
+class ChannelHistory:
+    """
+    Stored history of scraped posts per channel.
+
+    The high-water-mark message id (cursor) of each channel lives in Redis,
+    the posts themselves in the day-partitioned `posts` table.
+    """
+
+    def __init__(self, retention_hours: int, prefix: str = "digest:history"):
+        self.retention_hours = retention_hours
+        self.prefix = prefix
+
+    def _cursor_key(self, channel: str) -> str:
+        return f"{self.prefix}:{channel.lower()}:cursor"
+
+    async def get_cursor(self, channel: str) -> int:
+        value = await get_redis().get(self._cursor_key(channel))
+        return int(value) if value is not None else 0
+
+    async def merge(self, channel: str, posts: list[Post], cursor: int) -> None:
+        """Bulk-upsert a new batch of posts and advance the cursor."""
+        async with async_session_maker() as session:
+            repo = PostRepository(session)
+            await repo.upsert_many(
+                channel.lower(),
+                [
+                    {
+                        "message_id": p.id,
+                        "text": p.text,
+                        "link": p.link,
+                        "posted_at": _as_utc(p.date),
+                        "media_group_id": p.media_group_id,
+                        "forward_key": p.forward_key,
+                    }
+                    for p in posts
+                ],
+            )
+
+        await get_redis().set(self._cursor_key(channel), cursor)
+
+    async def read(self, channel: str, since: datetime) -> list[Post]:
+        """Return stored posts newer than `since`, newest first."""
+        async with async_session_maker() as session:
+            repo = PostRepository(session)
+            rows = await repo.get_recent(channel.lower(), since)
+
+        return [_to_post(row) for row in rows]
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Pyrogram returns naive UTC datetimes
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _to_post(row: ChannelPost) -> Post:
+    return Post(
+        id=row.message_id,
+        text=row.text,
+        link=row.link,
+        date=row.posted_at.astimezone(timezone.utc).replace(tzinfo=None),
+        media_group_id=row.media_group_id,
+        forward_key=row.forward_key,
+    )
+
+
+channel_history = ChannelHistory(retention_hours=settings.history_retention_hours)
+
+
+async def sync_channel(channel: str) -> int:
+    """
+    Fetch only messages newer than the stored cursor and merge them.
+
+    Returns:
+        Number of new posts stored
+    """
+    started = time.perf_counter()
+    cursor = await channel_history.get_cursor(channel)
+    posts, max_id = await fetch_new_posts(
+        channel,
+        min_id=cursor,
+        hours=channel_history.retention_hours,
+        warn_messages=settings.scrape_warn_messages,
+    )
+    await channel_history.merge(channel, posts, max_id)
+
+    SCRAPE_LATENCY.observe(time.perf_counter() - started)
+    POSTS_FETCHED.observe(len(posts))
+    logger.info(f"Synced {channel}: {len(posts)} new posts, cursor {cursor} -> {max_id}")
+    return len(posts)
+
+
+async def get_recent_posts(channel: str, hours: int = 24) -> list[Post]:
+    """Sync a channel incrementally and return its posts for the last N hours."""
+    channel = channel.lstrip("@")
+    await sync_channel(channel)
+
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    return await channel_history.read(channel, since)
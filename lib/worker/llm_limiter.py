@@ -0,0 +1,191 @@
+"""Distributed adaptive concurrency limit for LLM calls, shared through Redis."""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from lib.core.config import settings
+from lib.core.metrics import Counter, Gauge, Histogram
+from lib.core.redis import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+ACQUIRE_WAIT = Histogram(
+    "digest_llm_slot_wait_seconds",
+    "Time spent waiting for a distributed LLM concurrency slot",
+)
+CONCURRENCY_LIMIT = Gauge(
+    "digest_llm_concurrency_limit",
+    "Current adaptive LLM concurrency limit as last seen by this process",
+)
+OVERLOADS = Counter(
+    "digest_llm_overload_total",
+    "LLM calls that hit a provider rate limit",
+)
+
+# Drop expired leases, then take a slot if fewer than floor(limit) are held.
+# KEYS: holders zset, limit key. ARGV: now, token, lease expiry, initial limit
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local limit = tonumber(redis.call('GET', KEYS[2]) or ARGV[4])
+if redis.call('ZCARD', KEYS[1]) < math.max(1, math.floor(limit)) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# AIMD update of the shared limit. Decreases are applied at most once per
+# cooldown so one burst of 429s halves the limit once, not once per caller.
+# KEYS: limit key, last decrease key.
+# ARGV: outcome, initial, min, max, now, cooldown, decrease factor
+_UPDATE_SCRIPT = """
+local limit = tonumber(redis.call('GET', KEYS[1]) or ARGV[2])
+local min_limit = tonumber(ARGV[3])
+local max_limit = tonumber(ARGV[4])
+local now = tonumber(ARGV[5])
+if ARGV[1] == 'increase' then
+    limit = math.min(max_limit, limit + 1 / limit)
+else
+    local last = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if now - last >= tonumber(ARGV[6]) then
+        limit = math.max(min_limit, limit * tonumber(ARGV[7]))
+        redis.call('SET', KEYS[2], ARGV[5])
+    end
+end
+redis.call('SET', KEYS[1], tostring(limit))
+return tostring(limit)
+"""
+
+OVERLOAD_DECREASE = 0.5
+SLOW_DECREASE = 0.9
+DECREASE_COOLDOWN = 5.0  # seconds
+
+
+class AdaptiveLimiter:
+    """
+    Redis-backed semaphore whose size adapts with AIMD.
+
+    Every successful call under the target latency raises the limit by
+    1/limit (about +1 per full round of calls); a rate-limited call halves
+    it and a slow one shrinks it by 10%. Held slots are leases that expire,
+    so a crashed worker can't leak capacity.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: float,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float,
+        acquire_timeout: float,
+        lease: float,
+        overload_errors: tuple[type[BaseException], ...] = (),
+    ):
+        self.prefix = f"digest:limiter:{name}"
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.acquire_timeout = acquire_timeout
+        self.lease = lease
+        self.overload_errors = overload_errors
+
+    async def acquire(self) -> str:
+        redis = get_redis()
+        token = uuid.uuid4().hex
+        started = time.monotonic()
+        delay = 0.05
+
+        while True:
+            now = time.time()
+            acquired = await redis.eval(
+                _ACQUIRE_SCRIPT,
+                2,
+                f"{self.prefix}:holders",
+                f"{self.prefix}:limit",
+                now,
+                token,
+                now + self.lease,
+                self.initial,
+            )
+            if acquired:
+                ACQUIRE_WAIT.observe(time.monotonic() - started)
+                return token
+
+            if time.monotonic() - started > self.acquire_timeout:
+                raise TimeoutError(f"No LLM slot available after {self.acquire_timeout}s")
+
+            # Jittered backoff so waiting workers don't poll in lockstep
+            await asyncio.sleep(random.uniform(0, delay))
+            delay = min(delay * 2, 1.0)
+
+    async def release(self, token: str, latency: float, outcome: str) -> None:
+        redis = get_redis()
+        await redis.zrem(f"{self.prefix}:holders", token)
+
+        if outcome == "overload":
+            OVERLOADS.inc()
+            await self._update("decrease", OVERLOAD_DECREASE)
+        elif outcome == "success" and latency > self.target_latency:
+            await self._update("decrease", SLOW_DECREASE)
+        elif outcome == "success":
+            await self._update("increase", 1.0)
+
+    async def _update(self, direction: str, factor: float) -> None:
+        limit = await get_redis().eval(
+            _UPDATE_SCRIPT,
+            2,
+            f"{self.prefix}:limit",
+            f"{self.prefix}:last_decrease",
+            direction,
+            self.initial,
+            self.min_limit,
+            self.max_limit,
+            time.time(),
+            DECREASE_COOLDOWN,
+            factor,
+        )
+        CONCURRENCY_LIMIT.set(float(limit))
+        if direction == "decrease":
+            logger.info(f"LLM concurrency limit decreased to {float(limit):.2f}")
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one slot for the duration of the block and feed its outcome back."""
+        token = await self.acquire()
+        started = time.monotonic()
+        outcome = "error"
+
+        try:
+            yield
+            outcome = "success"
+        except self.overload_errors:
+            outcome = "overload"
+            raise
+        finally:
+            await self.release(token, time.monotonic() - started, outcome)
+
+
+def create_llm_limiter(
+    overload_errors: tuple[type[BaseException], ...],
+    name: str = "openrouter",
+    max_limit: int | None = None,
+) -> AdaptiveLimiter:
+    max_limit = max_limit or settings.llm_max_concurrency
+    return AdaptiveLimiter(
+        name=name,
+        initial=min(settings.llm_initial_concurrency, max_limit),
+        min_limit=min(settings.llm_min_concurrency, max_limit),
+        max_limit=max_limit,
+        target_latency=settings.llm_target_latency,
+        acquire_timeout=settings.llm_acquire_timeout,
+        lease=settings.llm_slot_lease,
+        overload_errors=overload_errors,
+    )
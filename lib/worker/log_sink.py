@@ -0,0 +1,75 @@
+"""Buffered sink that writes DigestLog rows in bulk."""
+
+import logging
+from datetime import datetime, timezone
+
+from lib.core.config import settings
+from lib.db.database import async_session_maker
+from lib.db.repositories import DigestLogRepository
+
+
+logger = logging.getLogger(__name__)
+
+
+class DigestLogSink:
+    """
+    Buffers digest log records and flushes them as one multi-row INSERT.
+
+    A flush happens when `flush_size` records are buffered and at the end of
+    every Celery task (see celery_app): the worker's event loop only runs
+    during tasks, so a timer could not fire while the worker is idle.
+    `close` drains what is left and must run before the worker process exits.
+    """
+
+    def __init__(self, flush_size: int):
+        self.flush_size = flush_size
+        self._buffer: list[dict] = []
+
+    async def add(
+        self,
+        user_id: int,
+        channel: str,
+        items_count: int = 0,
+        tokens_used: int = 0,
+        status: str = "success",
+        error_message: str | None = None,
+        model: str | None = None,
+    ) -> None:
+        self._buffer.append(
+            {
+                "user_id": user_id,
+                "channel": channel,
+                "items_count": items_count,
+                "tokens_used": tokens_used,
+                "status": status,
+                "error_message": error_message,
+                "model": model,
+                # Keep the outcome time, not the flush time
+                "created_at": datetime.now(timezone.utc),
+            }
+        )
+
+        if len(self._buffer) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self) -> int:
+        if not self._buffer:
+            return 0
+
+        records, self._buffer = self._buffer, []
+
+        try:
+            async with async_session_maker() as session:
+                await DigestLogRepository(session).create_many(records)
+        except Exception as e:
+            logger.exception(f"Failed to write {len(records)} digest log records: {e}")
+            return 0
+
+        logger.debug(f"Flushed {len(records)} digest log records")
+        return len(records)
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+digest_log_sink = DigestLogSink(flush_size=settings.digest_log_flush_size)
@@ -0,0 +1,67 @@
+"""Opt-in cProfile capture of Celery tasks."""
+
+import cProfile
+import logging
+import random
+import time
+from pathlib import Path
+
+from lib.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class TaskProfiler:
+    """
+    Profiles selected task runs and dumps them as .prof files.
+
+    A run is profiled if its task is listed in `tasks` or, otherwise, with
+    probability `sample_rate`. The event loop runs inside the task, so the
+    profile covers every coroutine the task awaited. Inspect dumps with
+    `python -m pstats` or snakeviz.
+    """
+
+    def __init__(self, tasks: list[str], sample_rate: float, directory: str):
+        self.tasks = {name.rsplit(".", 1)[-1] for name in tasks}
+        self.sample_rate = sample_rate
+        self.directory = Path(directory)
+        self._running: dict[str, cProfile.Profile] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tasks) or self.sample_rate > 0
+
+    def start(self, task_id: str, task_name: str) -> None:
+        short_name = task_name.rsplit(".", 1)[-1]
+        if short_name not in self.tasks and random.random() >= self.sample_rate:
+            return
+
+        profile = cProfile.Profile()
+        self._running[task_id] = profile
+        profile.enable()
+
+    def stop(self, task_id: str, task_name: str, trace_id: str | None = None) -> Path | None:
+        profile = self._running.pop(task_id, None)
+        if profile is None:
+            return None
+        profile.disable()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        path = self.directory / f"{task_name.rsplit('.', 1)[-1]}-{stamp}-{trace_id or task_id}.prof"
+        try:
+            profile.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"Failed to write profile of task {task_id}: {e}")
+            return None
+
+        logger.info(f"Profile of {task_name} saved to {path}")
+        return path
+
+
+task_profiler = TaskProfiler(
+    tasks=settings.profile_tasks,
+    sample_rate=settings.profile_sample_rate,
+    directory=settings.profile_dir,
+)
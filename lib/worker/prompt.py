@@ -0,0 +1,100 @@
+"""Compact, token-budgeted encoding of posts for the LLM prompt."""
+
+import json
+import re
+from dataclasses import dataclass
+
+from lib.worker.scraper import Post
+
+
+# Rough average for mixed Cyrillic/Latin text; errs on the side of more tokens
+CHARS_PER_TOKEN = 3
+
+# Below this many tokens per post, drop the oldest posts instead of truncating more
+MIN_POST_TOKENS = 40
+
+_SHORT_LINK_RE = re.compile(r'href=(["\'])(p\d+)\1')
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class EncodedPosts:
+    text: str
+    links: dict[str, str]  # short id -> post link
+    tokens: int
+    tokens_saved: int
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _legacy_json(posts: list[Post]) -> str:
+    # The previous prompt format, kept only to measure savings against
+    posts_data = [{"id": p.id, "text": p.text[:2000], "link": p.link} for p in posts]
+    return json.dumps(posts_data, ensure_ascii=False, indent=2)
+
+
+def _token_cap(lengths: list[int], budget: int) -> int | None:
+    """Largest per-post token cap that fits all posts into the budget (None: no cap)."""
+    if sum(lengths) <= budget:
+        return None
+
+    remaining = budget
+    ordered = sorted(lengths)
+    for i, length in enumerate(ordered):
+        share = remaining // (len(ordered) - i)
+        if length > share:
+            return share
+        remaining -= length
+    return None
+
+
+def encode_posts(posts: list[Post], token_budget: int) -> EncodedPosts:
+    """
+    Encode posts as one line each: `[p1] text`.
+
+    Links are replaced with short ids (restored by `restore_links`) and
+    whitespace is collapsed. If the posts don't fit into `token_budget`, the
+    longest ones are truncated to a common cap; if that cap would get too
+    small, the oldest posts are dropped first.
+    """
+    texts = [_WHITESPACE_RE.sub(" ", p.text).strip() for p in posts]
+
+    # Posts come newest first; drop from the end until truncation is sensible
+    count = len(texts)
+    while count > 1 and token_budget // count < MIN_POST_TOKENS:
+        count -= 1
+    texts = texts[:count]
+
+    # Per-line overhead: "[pNN] " and the newline
+    overhead = 3
+    lengths = [estimate_tokens(t) + overhead for t in texts]
+    cap = _token_cap(lengths, token_budget)
+
+    lines = []
+    links = {}
+    for i, (post, text) in enumerate(zip(posts, texts), start=1):
+        if cap is not None:
+            text = text[: max(cap - overhead, 0) * CHARS_PER_TOKEN]
+        short_id = f"p{i}"
+        links[short_id] = post.link
+        lines.append(f"[{short_id}] {text}")
+
+    encoded = "\n".join(lines)
+    tokens = estimate_tokens(encoded)
+    return EncodedPosts(
+        text=encoded,
+        links=links,
+        tokens=tokens,
+        # Against the same posts in the old format; dropped posts saved nothing
+        tokens_saved=max(estimate_tokens(_legacy_json(posts[:count])) - tokens, 0),
+    )
+
+
+def restore_links(text: str, links: dict[str, str]) -> str:
+    """Replace short post ids in generated hrefs with the real post links."""
+    return _SHORT_LINK_RE.sub(
+        lambda m: f'href="{links.get(m.group(2), m.group(2))}"',
+        text,
+    )
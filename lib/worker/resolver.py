@@ -0,0 +1,76 @@
+"""Channel username resolution over MTProto, cached in Redis."""
+
+import json
+import logging
+
+from pyrogram.errors import ChannelPrivate, UsernameInvalid, UsernameNotOccupied
+
+from lib.core.config import settings
+from lib.core.redis import get_redis
+from lib.worker.scraper import start_client
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "digest:resolve"
+
+# Resolution outcomes
+RESOLVED = "ok"
+NOT_FOUND = "not_found"  # cached for the negative TTL
+FAILED = "error"  # anything else (flood wait, network, session)
+
+# A failure is kept only long enough for the bot polling for it to see it
+FAILED_TTL = 15  # seconds
+
+# Errors that prove the channel can't be read, as opposed to our own trouble
+_NOT_FOUND_ERRORS = (UsernameNotOccupied, UsernameInvalid, ChannelPrivate)
+
+
+def _key(channel: str) -> str:
+    return f"{KEY_PREFIX}:{channel}"
+
+
+def normalize_channel(channel: str) -> str:
+    return channel.strip().lstrip("@").lower()
+
+
+async def get_cached_resolution(channel: str) -> dict | None:
+    """Return a cached resolution of a channel, without touching MTProto."""
+    cached = await get_redis().get(_key(normalize_channel(channel)))
+    return json.loads(cached) if cached is not None else None
+
+
+async def resolve_channel(channel: str) -> dict:
+    """
+    Check that a public channel exists and is readable by the userbot.
+
+    Args:
+        channel: Channel username, with or without "@"
+
+    Returns:
+        {"status": "ok", "username": canonical lowercase username}, or
+        {"status": "not_found" | "error", "username": the requested username}
+    """
+    channel = normalize_channel(channel)
+
+    cached = await get_cached_resolution(channel)
+    if cached is not None:
+        return cached
+
+    try:
+        client = await start_client()
+        chat = await client.get_chat(channel)
+    except _NOT_FOUND_ERRORS as e:
+        logger.info(f"Channel {channel} is not accessible: {e}")
+        result = {"status": NOT_FOUND, "username": channel}
+        await get_redis().set(_key(channel), json.dumps(result), ex=settings.channel_resolve_negative_ttl)
+        return result
+    except Exception as e:
+        logger.warning(f"Failed to resolve channel {channel}: {type(e).__name__}: {e}")
+        result = {"status": FAILED, "username": channel}
+        await get_redis().set(_key(channel), json.dumps(result), ex=FAILED_TTL)
+        return result
+
+    result = {"status": RESOLVED, "username": (chat.username or channel).lower()}
+    await get_redis().set(_key(channel), json.dumps(result), ex=settings.channel_resolve_ttl)
+    return result
@@ -1,5 +1,9 @@
 """Pyrogram client for scraping Telegram channels."""
 
+import asyncio
+import logging
+import shutil
+import tempfile
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -10,8 +14,16 @@ from pyrogram.types import Message
 from lib.core.config import settings
 
 
+logger = logging.getLogger(__name__)
+
 SESSION_NAME = "digest_bot"
 
+# Process-wide client, started lazily by the first task of a worker process
+_client: Client | None = None
+_client_lock = asyncio.Lock()
+# Temporary directory holding this process's copy of the session file
+_client_workdir: str | None = None
+
 
 def _get_workdir() -> str:
     """Get workdir for session - works both locally and in Docker."""
@@ -30,17 +42,129 @@ class Post:
     text: str
     link: str
     date: datetime
-
-
-def get_pyrogram_client() -> Client:
+    media_group_id: str | None = None
+    # "<chat id>:<message id>" of the original post for forwards
+    forward_key: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "text": self.text,
+            "link": self.link,
+            "date": self.date.isoformat(),
+            "media_group_id": self.media_group_id,
+            "forward_key": self.forward_key,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Post":
+        return cls(
+            id=data["id"],
+            text=data["text"],
+            link=data["link"],
+            date=datetime.fromisoformat(data["date"]),
+            media_group_id=data.get("media_group_id"),
+            forward_key=data.get("forward_key"),
+        )
+
+
+def get_pyrogram_client(workdir: str) -> Client:
     return Client(
         name=SESSION_NAME,
         api_id=settings.api_id,
         api_hash=settings.api_hash,
-        workdir=_get_workdir(),
+        workdir=workdir,
     )
 
 
+def _copy_session() -> str:
+    """
+    Copy the session file into a fresh temporary directory.
+
+    Pyrogram keeps its SQLite storage open with uncommitted writes until the
+    client stops, so clients in several processes can't share one file: all
+    but the first get "database is locked". Each process works on its own
+    copy; the original is only read.
+    """
+    source = Path(_get_workdir()) / f"{SESSION_NAME}.session"
+    if not source.exists():
+        raise RuntimeError(
+            f"Pyrogram session {source} not found, create it with "
+            "`uv run python -m lib.scripts.auth_pyrogram`"
+        )
+
+    workdir = tempfile.mkdtemp(prefix=f"{SESSION_NAME}-")
+    shutil.copyfile(source, Path(workdir) / source.name)
+    return workdir
+
+
+def _discard_client() -> None:
+    global _client, _client_workdir
+
+    _client = None
+    if _client_workdir is not None:
+        shutil.rmtree(_client_workdir, ignore_errors=True)
+        _client_workdir = None
+
+
+async def start_client() -> Client:
+    """
+    Start the process-wide Pyrogram client and warm it up.
+
+    Safe to call repeatedly: an already connected client is returned as is,
+    a disconnected one is restarted. The client runs on a private copy of
+    the session file (see _copy_session).
+    """
+    global _client, _client_workdir
+
+    async with _client_lock:
+        if _client is None:
+            _client_workdir = _copy_session()
+            _client = get_pyrogram_client(_client_workdir)
+
+        if not _client.is_connected:
+            await _client.start()
+            me = await _client.get_me()
+            logger.info(f"Pyrogram client started as {me.username or me.id}")
+
+        return _client
+
+
+def install_client(client: Client) -> None:
+    """
+    Use an already constructed client as the process-wide one.
+
+    Meant for benchmarks that replace MTProto with a local fake; the client
+    must report `is_connected` so `start_client` doesn't try to start it.
+    """
+    global _client
+    _client = client
+
+
+async def stop_client() -> None:
+    """Stop the process-wide Pyrogram client if it is running."""
+    async with _client_lock:
+        try:
+            if _client is not None and _client.is_connected:
+                await _client.stop()
+                logger.info("Pyrogram client stopped")
+        finally:
+            _discard_client()
+
+
+async def _restart_client() -> Client:
+    async with _client_lock:
+        if _client is not None:
+            try:
+                if _client.is_connected:
+                    await _client.stop()
+            except Exception as e:
+                logger.warning(f"Error while stopping Pyrogram client: {e}")
+        _discard_client()
+
+    return await start_client()
+
+
 def _build_post_link(channel_username: str, message_id: int) -> str:
     return f"https://t.me/{channel_username}/{message_id}"
 
@@ -61,64 +185,88 @@ def _extract_text(message: Message) -> str:
     return message.text or message.caption or ""
 
 
-async def fetch_channel_posts(
+def _forward_key(message: Message) -> str | None:
+    if message.forward_from_chat and message.forward_from_message_id:
+        return f"{message.forward_from_chat.id}:{message.forward_from_message_id}"
+    return None
+
+
+def _build_post(channel_username: str, message: Message, text: str) -> Post:
+    return Post(
+        id=message.id,
+        text=text,
+        link=_build_post_link(channel_username, message.id),
+        date=message.date,
+        media_group_id=str(message.media_group_id) if message.media_group_id else None,
+        forward_key=_forward_key(message),
+    )
+
+
+async def fetch_new_posts(
     channel_username: str,
+    min_id: int = 0,
     hours: int = 24,
-    limit: int = 100,
-) -> list[Post]:
+    warn_messages: int = 1000,
+) -> tuple[list[Post], int]:
     """
-    Fetch posts from a Telegram channel for the last N hours.
+    Fetch posts newer than a known message id.
+
+    History is read newest-first, page by page, down to the first message
+    with id <= min_id or the age cutoff. Every message above the cursor is
+    read, so the returned id can safely become the new cursor.
 
     Args:
         channel_username: Channel username without @
-        hours: How many hours back to fetch (default 24)
-        limit: Max number of messages to fetch (default 100)
+        min_id: High-water-mark message id already stored (0 if none)
+        hours: Never go further back than this many hours
+        warn_messages: Log a warning when one call reads more messages
 
     Returns:
-        List of Post objects with id, text, link, date
+        Tuple of (new posts, highest message id seen)
     """
     channel_username = channel_username.lstrip("@")
-    cutoff_time = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
-    posts: list[Post] = []
+    client = await start_client()
 
-    client = get_pyrogram_client()
+    try:
+        return await _read_new_history(client, channel_username, min_id, hours, warn_messages)
+    except (ConnectionError, OSError) as e:
+        logger.warning(f"Pyrogram connection lost ({e}), reconnecting")
+        client = await _restart_client()
+        return await _read_new_history(client, channel_username, min_id, hours, warn_messages)
 
-    async with client:
-        async for message in client.get_chat_history(channel_username, limit=limit):
-            # Stop if message is older than cutoff
-            if message.date < cutoff_time:
-                break
 
-            if not _is_valid_message(message):
-                continue
+async def _read_new_history(
+    client: Client,
+    channel_username: str,
+    min_id: int,
+    hours: int,
+    warn_messages: int,
+) -> tuple[list[Post], int]:
+    cutoff_time = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
+    posts: list[Post] = []
+    max_id = min_id
+    read = 0
 
-            text = _extract_text(message)
-            if not text.strip():
-                continue
+    # Without a limit Pyrogram keeps requesting pages below the oldest
+    # message read (offset_id) until we stop iterating
+    async for message in client.get_chat_history(channel_username):
+        # Stop at the stored high-water mark or the age cutoff
+        if message.id <= min_id or message.date < cutoff_time:
+            break
 
-            post = Post(
-                id=message.id,
-                text=text,
-                link=_build_post_link(channel_username, message.id),
-                date=message.date,
-            )
-            posts.append(post)
+        read += 1
+        max_id = max(max_id, message.id)
 
-    return posts
+        if not _is_valid_message(message):
+            continue
 
+        text = _extract_text(message)
+        if not text.strip():
+            continue
 
-async def test_channel_access(channel_username: str) -> bool:
-    """
-    Test if we can access a channel.
+        posts.append(_build_post(channel_username, message, text))
 
-    Returns True if accessible, False otherwise.
-    """
-    channel_username = channel_username.lstrip("@")
-    client = get_pyrogram_client()
+    if read > warn_messages:
+        logger.warning(f"Read {read} new messages from {channel_username} in one sync")
 
-    try:
-        async with client:
-            chat = await client.get_chat(channel_username)
-            return chat is not None
-    except Exception:
-        return False
+    return posts, max_id
@@ -0,0 +1,93 @@
+"""Redis-coordinated single-flight execution shared by all worker processes."""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from lib.core.config import settings
+from lib.core.redis import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+POLL_INTERVAL = 0.5  # seconds
+
+# Delete the lock only if it still holds our token, so a caller whose lock
+# expired can't release the lock of the next leader
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+async def single_flight(
+    key: str,
+    compute: Callable[[], Awaitable[T]],
+    load: Callable[[], Awaitable[T | None]],
+    lock_ttl: float,
+    wait_timeout: float,
+) -> T:
+    """
+    Run `compute` once for all concurrent callers of `key`.
+
+    The first caller takes a Redis lock and runs `compute`, which must store
+    its result where `load` finds it. Other callers poll `load` until the
+    result shows up, and run `compute` themselves if the leader fails or
+    doesn't finish within `wait_timeout` seconds.
+
+    Args:
+        key: Identifies the computation; the lock is stored under "{key}:lock"
+        compute: Produces and stores the result
+        load: Returns the stored result, or None while there is none
+        lock_ttl: Seconds after which a lock of a crashed leader expires
+        wait_timeout: Max seconds a follower waits for the leader
+
+    Returns:
+        The result computed by this caller or by the leader
+    """
+    redis = get_redis()
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+
+    if await redis.set(lock_key, token, nx=True, ex=int(lock_ttl)):
+        try:
+            return await compute()
+        finally:
+            await redis.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+
+    logger.info(f"Waiting for concurrent computation of {key}")
+    deadline = time.monotonic() + wait_timeout
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        result = await load()
+        if result is not None:
+            return result
+        if not await redis.exists(lock_key):
+            break
+
+    return await compute()
+
+
+def _user_digest_key(user_id: int) -> str:
+    return f"digest:inflight:user:{user_id}"
+
+
+async def try_start_user_digest(user_id: int) -> bool:
+    """Mark a manual digest of a user as in flight. Returns False if one already is."""
+    return bool(
+        await get_redis().set(
+            _user_digest_key(user_id), "1", nx=True, ex=settings.digest_inflight_ttl
+        )
+    )
+
+
+async def finish_user_digest(user_id: int) -> None:
+    await get_redis().delete(_user_digest_key(user_id))
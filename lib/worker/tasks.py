@@ -1,196 +1,494 @@
 import asyncio
-from datetime import datetime
-import html
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+from functools import partial
 import logging
-import re
+import time
+from typing import TypeVar
 
-import httpx
+from celery import chord, group
+from celery.exceptions import SoftTimeLimitExceeded
 
 from lib.core.config import settings
+from lib.core.metrics import Counter, Histogram
+from lib.core.tracing import get_trace_id, span, trace
 from lib.db.database import async_session_maker
-from lib.db.repositories import DigestLogRepository, UserRepository
+from lib.db.repositories import PostRepository, UserRepository
 from lib.worker.ai_client import generate_digest
+from lib.worker.cache import get_channel_posts, post_cache
 from lib.worker.celery_app import app
-from lib.worker.scraper import fetch_channel_posts
+from lib.worker.dedup import coalesce_posts
+from lib.worker.log_sink import digest_log_sink
+from lib.worker.delivery import LiveMessage, send_html_message
+from lib.worker.resolver import resolve_channel
+from lib.worker.singleflight import finish_user_digest
 
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
 
-def _sanitize_telegram_html(text: str) -> str:
-    """
-    Sanitize HTML for Telegram - escape invalid chars but preserve allowed tags.
-    Telegram allows: <b>, <i>, <u>, <s>, <code>, <pre>, <a href="">.
-    """
-    # First, escape all HTML entities
-    text = html.escape(text)
+DELIVERY_BATCH_SIZE = 50  # users per delivery task
 
-    # Then restore allowed tags
-    # Restore <b> and </b>
-    text = re.sub(r'&lt;b&gt;', '<b>', text)
-    text = re.sub(r'&lt;/b&gt;', '</b>', text)
+PREPARE_LATENCY = Histogram(
+    "digest_prepare_seconds",
+    "Time to scrape, deduplicate and summarize one channel",
+    ("status",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+DELIVERIES = Counter(
+    "digest_deliveries_total",
+    "Digests delivered to users",
+    ("status",),
+)
 
-    # Restore <i> and </i>
-    text = re.sub(r'&lt;i&gt;', '<i>', text)
-    text = re.sub(r'&lt;/i&gt;', '</i>', text)
 
-    # Restore <a href="..."> and </a>
-    text = re.sub(r'&lt;a href=&quot;([^&]+)&quot;&gt;', r'<a href="\1">', text)
-    text = re.sub(r'&lt;/a&gt;', '</a>', text)
-
-    return text
+def _run(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine on the worker process's event loop.
 
+    If the soft time limit interrupts the loop, the coroutine is cancelled
+    and drained before the exception propagates, so it can't resume inside
+    the next task that runs on this loop.
+    """
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(coro)
+    try:
+        return loop.run_until_complete(task)
+    except SoftTimeLimitExceeded:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except (asyncio.CancelledError, Exception):
+            pass
+        raise
 
-async def _send_telegram_message(chat_id: int, text: str) -> bool:
-    """Send message via Telegram Bot API."""
-    url = f"https://api.telegram.org/bot{settings.bot_token}/sendMessage"
 
-    # Telegram message limit is 4096 characters
-    MAX_LENGTH = 4096
+def _error_result(channel: str, message: str) -> dict:
+    return {
+        "channel": channel,
+        "status": "error",
+        "error_message": message[:1000],
+    }
 
-    # Truncate if too long
-    if len(text) > MAX_LENGTH:
-        text = text[:MAX_LENGTH - 50] + "\n\n... (сообщение обрезано)"
-        logger.warning(f"Message truncated to {MAX_LENGTH} chars for chat {chat_id}")
 
-    async with httpx.AsyncClient() as client:
-        # Try with HTML first (sanitize to fix invalid entities)
-        sanitized_text = _sanitize_telegram_html(text)
+async def _prepare_channel_digest(
+    channel: str,
+    on_update: Callable[[str], Awaitable[None]] | None = None,
+    interactive: bool = False,
+) -> dict:
+    """
+    Scrape a channel and summarize it once.
 
-        # Check if text is empty after sanitization
-        if not sanitized_text.strip():
-            logger.error("Message is empty after sanitization, original text was: %s", text[:500])
-            sanitized_text = text  # Use original text as fallback
+    Returns a JSON-serializable result that is delivered to every user of
+    the channel; errors are reported in it instead of being raised.
+    `on_update` streams the digest as it is generated (see generate_digest).
+    Generation is cut off after llm_generation_timeout seconds; `interactive`
+    marks a manual digest that uses reserved LLM capacity.
+    """
+    started = time.perf_counter()
+    try:
+        # Fetch posts from channel (shared with other users of the channel)
+        with span(f"scrape {channel}"):
+            posts = await get_channel_posts(channel, hours=24)
+
+        logger.info(f"Fetched {len(posts)} posts from {channel}")
+
+        # Merge albums, forwards and near-duplicates before they cost tokens
+        with span(f"dedup {channel}"):
+            posts = coalesce_posts(posts)
+
+        # Generate digest via AI
+        with span(f"llm {channel}"):
+            digest_text, tokens_used, model = await generate_digest(
+                posts,
+                channel,
+                on_update=on_update,
+                interactive=interactive,
+                timeout=settings.llm_generation_timeout,
+            )
 
-        payload = {
-            "chat_id": chat_id,
-            "text": sanitized_text,
-            "parse_mode": "HTML",
-            "disable_web_page_preview": True,
+        PREPARE_LATENCY.observe(time.perf_counter() - started, status="success")
+        return {
+            "channel": channel,
+            "status": "success",
+            "text": digest_text,
+            "items_count": len(posts),
+            "tokens_used": tokens_used,
+            "model": model,
         }
-        response = await client.post(url, json=payload, timeout=30)
 
-        if response.status_code == 200:
-            return True
-
-        # Log the error
-        logger.error(f"Telegram API error (HTML): {response.status_code} - {response.text}")
+    except asyncio.TimeoutError:
+        logger.error(
+            f"Digest generation for channel {channel} timed out after "
+            f"{settings.llm_generation_timeout}s"
+        )
+        PREPARE_LATENCY.observe(time.perf_counter() - started, status="error")
+        return _error_result(channel, "Digest generation timed out")
+
+    except Exception as e:
+        logger.exception(f"Error generating digest for channel {channel}: {e}")
+        PREPARE_LATENCY.observe(time.perf_counter() - started, status="error")
+        return _error_result(channel, str(e))
+
+
+def _combine_digests(results: list[dict], with_headers: bool) -> str:
+    """Join per-channel digests into one message, one section per channel."""
+    if not with_headers:
+        return "\n\n".join(r["text"] for r in results if r["status"] == "success")
+
+    sections = []
+    for result in results:
+        body = (
+            result["text"]
+            if result["status"] == "success"
+            else "Не удалось получить дайджест. Попробуйте позже."
+        )
+        sections.append(f"📢 <b>@{result['channel']}</b>\n\n{body}")
+    return "\n\n".join(sections)
+
+
+async def _deliver_digest(
+    user_id: int,
+    results: list[dict],
+    live: LiveMessage | None = None,
+) -> None:
+    """
+    Send a user's combined digest built from prepared channel results and log the outcome.
 
-        # Fallback: try without HTML parsing (plain text)
-        payload_plain = {
-            "chat_id": chat_id,
-            "text": text,
-            "disable_web_page_preview": True,
-        }
-        response = await client.post(url, json=payload_plain, timeout=30)
+    With `live`, the streamed placeholder message is replaced by the digest.
+    """
+    send = live.finish if live else partial(send_html_message, user_id)
+    succeeded = [r for r in results if r["status"] == "success"]
 
-        if response.status_code == 200:
-            logger.info("Message sent successfully with plain text fallback")
-            return True
+    if not succeeded:
+        for result in results:
+            await digest_log_sink.add(
+                user_id=user_id,
+                channel=result["channel"],
+                status="error",
+                error_message=result.get("error_message"),
+            )
+        channels = ", ".join(f"@{r['channel']}" for r in results)
+        # Notify user about the error
+        await send(
+            f"Произошла ошибка при генерации дайджеста для {channels}.\n\n"
+            f"Попробуйте позже или проверьте, что каналы доступны.",
+        )
+        DELIVERIES.inc(status="error")
+        return
+
+    try:
+        with span(f"send {user_id}"):
+            sent = await send(_combine_digests(results, with_headers=len(results) > 1))
+    except Exception as e:
+        logger.exception(f"Error sending digest to user {user_id}: {e}")
+        sent = False
+
+    for result in results:
+        if result["status"] != "success":
+            await digest_log_sink.add(
+                user_id=user_id,
+                channel=result["channel"],
+                status="error",
+                error_message=result.get("error_message"),
+            )
+        elif sent:
+            await digest_log_sink.add(
+                user_id=user_id,
+                channel=result["channel"],
+                items_count=result["items_count"],
+                tokens_used=result["tokens_used"],
+                model=result.get("model"),
+                status="success",
+            )
+        else:
+            await digest_log_sink.add(
+                user_id=user_id,
+                channel=result["channel"],
+                items_count=result["items_count"],
+                tokens_used=result["tokens_used"],
+                model=result.get("model"),
+                status="error",
+                error_message="Failed to send message",
+            )
 
-        logger.error(f"Telegram API error (plain): {response.status_code} - {response.text}")
-        return False
+    DELIVERIES.inc(status="success" if sent else "error")
+    if sent:
+        logger.info(f"Digest sent to user {user_id}")
+    else:
+        logger.error(f"Failed to send digest to user {user_id}")
 
 
-async def _generate_digest_for_user(user_id: int, channel: str) -> None:
-    """Generate and send digest for a single user."""
-    logger.info(f"Generating digest for user {user_id}, channel: {channel}")
+async def _generate_digest_for_user(
+    user_id: int,
+    channels: list[str],
+    message_id: int | None = None,
+) -> None:
+    """
+    Generate and send the combined digest of a user's channels.
 
-    async with async_session_maker() as session:
-        log_repo = DigestLogRepository(session)
+    Up to digest_channel_concurrency channels are summarized at once and
+    streamed into a placeholder message (`message_id`, or a new one if not
+    given) that is edited as items complete, sections in subscription order.
+    """
+    logger.info(f"Generating digest for user {user_id}, channels: {', '.join(channels)}")
+
+    live = LiveMessage(user_id, message_id)
+    await live.start("Генерирую дайджест...")
+
+    with_headers = len(channels) > 1
+    semaphore = asyncio.Semaphore(settings.digest_channel_concurrency)
+    # Text shown so far per channel; complete items only, so a half-streamed
+    # tag never reaches Telegram
+    shown: dict[str, str] = {}
+
+    async def show_progress() -> None:
+        sections = [
+            {"channel": channel, "status": "success", "text": shown[channel]}
+            for channel in channels
+            if shown.get(channel)
+        ]
+        if sections:
+            # The trailing break lets LiveMessage show every complete section
+            await live.update(_combine_digests(sections, with_headers) + "\n\n")
+
+    async def prepare(channel: str) -> dict:
+        async def on_update(text: str) -> None:
+            shown[channel] = text[:max(text.rfind("\n\n"), 0)]
+            await show_progress()
+
+        async with semaphore:
+            result = await _prepare_channel_digest(channel, on_update=on_update, interactive=True)
+
+        if result["status"] == "success":
+            shown[channel] = result["text"]
+            await show_progress()
+        return result
+
+    results = list(await asyncio.gather(*(prepare(channel) for channel in channels)))
+    await _deliver_digest(user_id, results, live=live)
+
+
+@app.task(
+    name="lib.worker.tasks.generate_digest_task",
+    soft_time_limit=settings.task_soft_time_limit,
+)
+def generate_digest_task(
+    user_id: int,
+    channels: list[str],
+    message_id: int | None = None,
+    trace_id: str | None = None,
+) -> dict:
+    """
+    Celery task: Generate digest of all given channels for a specific user.
+    Called manually via /digest command, which marks the digest as in flight
+    and passes the trace id of the request.
 
+    If the soft time limit hits, the placeholder is replaced by an error
+    instead of being left as is.
+    """
+    status = "completed"
+    with trace(trace_id):
         try:
-            # Fetch posts from channel
-            posts = await fetch_channel_posts(channel, hours=24)
+            _run(_generate_digest_for_user(user_id, channels, message_id))
+        except SoftTimeLimitExceeded:
+            logger.error(f"Digest for user {user_id} exceeded the soft time limit")
+            status = "timeout"
+            _run(
+                send_html_message(
+                    user_id,
+                    "Не удалось подготовить дайджест вовремя. Попробуйте позже.",
+                    edit_message_id=message_id,
+                )
+            )
+        finally:
+            # Lets the user request the next digest
+            _run(finish_user_digest(user_id))
+    return {"user_id": user_id, "channels": channels, "status": status}
 
-            logger.info(f"Fetched {len(posts)} posts from {channel}")
 
-            # Generate digest via AI
-            digest_text, tokens_used = await generate_digest(posts)
+@app.task(name="lib.worker.tasks.resolve_channel_task")
+def resolve_channel_task(channel: str) -> dict:
+    """
+    Celery task: Check that a channel exists and is readable.
+    Called by the bot while adding a channel, so the bot never opens MTProto itself.
+    """
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(resolve_channel(channel))
 
-            # Send to user
-            sent = await _send_telegram_message(user_id, digest_text)
 
-            if sent:
-                await log_repo.create(
-                    user_id=user_id,
-                    channel=channel,
-                    items_count=len(posts),
-                    tokens_used=tokens_used,
-                    status="success",
-                )
-                logger.info(f"Digest sent to user {user_id}")
-            else:
-                await log_repo.create(
-                    user_id=user_id,
-                    channel=channel,
-                    items_count=len(posts),
-                    tokens_used=tokens_used,
-                    status="error",
-                    error_message="Failed to send message",
-                )
-                logger.error(f"Failed to send digest to user {user_id}")
+@app.task(
+    name="lib.worker.tasks.prepare_channel_digest_task",
+    soft_time_limit=settings.task_soft_time_limit,
+)
+def prepare_channel_digest_task(channel_id: int, channel: str, trace_id: str | None = None) -> dict:
+    """
+    Celery task: Scrape and summarize one channel for a scheduled run.
+    Runs as part of the chord dispatched by scheduled_digest_task.
 
-        except Exception as e:
-            logger.exception(f"Error generating digest for user {user_id}: {e}")
-            await log_repo.create(
-                user_id=user_id,
-                channel=channel,
-                status="error",
-                error_message=str(e)[:1000],
-            )
-            # Notify user about the error
-            await _send_telegram_message(
-                user_id,
-                f"Произошла ошибка при генерации дайджеста для канала @{channel}.\n\n"
-                f"Попробуйте позже или проверьте, что канал доступен.",
+    Always returns a result, even when cut off by the soft time limit: a
+    killed header task would keep the chord from ever delivering the run.
+    """
+    with trace(trace_id):
+        try:
+            result = _run(_prepare_channel_digest(channel))
+        except SoftTimeLimitExceeded:
+            logger.error(f"Preparing digest of channel {channel} exceeded the soft time limit")
+            result = _error_result(channel, "Time limit exceeded")
+    return {"channel_id": channel_id, **result}
+
+
+@app.task(name="lib.worker.tasks.dispatch_deliveries_task")
+def dispatch_deliveries_task(
+    results: list[dict],
+    audiences: list[dict],
+    trace_id: str | None = None,
+) -> dict:
+    """
+    Celery task: Fan prepared channel digests out to their users.
+    Chord callback of scheduled_digest_task.
+
+    Each audience is a set of users subscribed to exactly the same channels,
+    so they all receive the same combined digest.
+    """
+    results_by_id = {r["channel_id"]: r for r in results}
+    deliveries = []
+
+    for audience in audiences:
+        audience_results = [results_by_id[cid] for cid in audience["channel_ids"]]
+        user_ids = audience["user_ids"]
+        for i in range(0, len(user_ids), DELIVERY_BATCH_SIZE):
+            deliveries.append(
+                deliver_digest_task.s(
+                    user_ids[i:i + DELIVERY_BATCH_SIZE], audience_results, trace_id=trace_id
+                )
             )
 
+    with trace(trace_id):
+        if deliveries:
+            group(deliveries).apply_async()
 
-@app.task(name="lib.worker.tasks.generate_digest_task")
-def generate_digest_task(user_id: int, channel: str) -> dict:
+        logger.info(f"Dispatched {len(deliveries)} delivery batches for {len(results)} channels")
+
+        # Every channel of the run has been prepared by now
+        stats = asyncio.get_event_loop().run_until_complete(post_cache.stats())
+        logger.info(
+            f"Post cache stats: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['entries']} entries"
+        )
+    return {"channels": len(results), "batches": len(deliveries), "status": "dispatched"}
+
+
+@app.task(name="lib.worker.tasks.deliver_digest_task")
+def deliver_digest_task(user_ids: list[int], results: list[dict], trace_id: str | None = None) -> dict:
     """
-    Celery task: Generate digest for a specific user.
-    Called manually via /digest command.
+    Celery task: Send one combined digest to a batch of users.
+
+    Users are served concurrently, so the global rate limit rather than the
+    per-chat spacing of multi-part digests sets the pace.
     """
+    semaphore = asyncio.Semaphore(settings.delivery_concurrency)
+
+    async def _deliver_one(user_id: int) -> None:
+        async with semaphore:
+            try:
+                await _deliver_digest(user_id, results)
+            except Exception as e:
+                logger.exception(f"Error for user {user_id}: {e}")
+
+    async def _deliver_batch():
+        await asyncio.gather(*(_deliver_one(user_id) for user_id in user_ids))
+
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(_generate_digest_for_user(user_id, channel))
-    return {"user_id": user_id, "channel": channel, "status": "completed"}
+    with trace(trace_id):
+        loop.run_until_complete(_deliver_batch())
+    return {
+        "channels": [r["channel"] for r in results],
+        "delivered_users": len(user_ids),
+        "status": "completed",
+    }
 
 
 @app.task(name="lib.worker.tasks.scheduled_digest_task")
 def scheduled_digest_task() -> dict:
     """
-    Celery task: Generate digests for users scheduled at current hour.
+    Celery task: Dispatch digests for users scheduled at current hour.
     Called by Celery Beat every hour.
+
+    Due subscriptions are grouped by channel, each channel is scraped and
+    summarized once by its own task, and delivery of the combined per-user
+    digests is fanned out in batches afterwards. All tasks of one run share
+    a trace id.
     """
-    async def _run_for_scheduled_users():
+    async def _collect_subscriptions() -> list[tuple[int, int, str]]:
         # Get current UTC time
-        now = datetime.now(datetime.timezone.utc)
+        now = datetime.now(timezone.utc)
         current_hour = now.hour
         current_minute = 0  # We run at the start of each hour
 
         async with async_session_maker() as session:
             user_repo = UserRepository(session)
-            # Get only users scheduled for this specific time
-            users = await user_repo.get_by_schedule_time(current_hour, current_minute)
-
-            logger.info(
-                f"Running scheduled digest for {len(users)} users at {current_hour:02d}:{current_minute:02d} UTC"
+            # Get only subscriptions of users scheduled for this specific time
+            subscriptions = await user_repo.get_scheduled_subscriptions(current_hour, current_minute)
+
+        logger.info(
+            f"Running scheduled digest for {len(subscriptions)} subscriptions "
+            f"at {current_hour:02d}:{current_minute:02d} UTC"
+        )
+
+        return subscriptions
+
+    with trace(None):
+        trace_id = get_trace_id()
+        loop = asyncio.get_event_loop()
+        subscriptions = loop.run_until_complete(_collect_subscriptions())
+
+    channels: dict[int, str] = {}
+    user_channels: dict[int, list[int]] = defaultdict(list)
+    for user_id, channel_id, username in subscriptions:
+        channels[channel_id] = username
+        user_channels[user_id].append(channel_id)
+
+    audiences: dict[tuple[int, ...], list[int]] = defaultdict(list)
+    for user_id, channel_ids in user_channels.items():
+        audiences[tuple(sorted(channel_ids))].append(user_id)
+
+    if channels:
+        chord(
+            prepare_channel_digest_task.s(channel_id, username, trace_id=trace_id)
+            for channel_id, username in channels.items()
+        )(
+            dispatch_deliveries_task.s(
+                [{"channel_ids": list(ids), "user_ids": users} for ids, users in audiences.items()],
+                trace_id=trace_id,
             )
+        )
+
+    return {
+        "processed_users": len(user_channels),
+        "channels": len(channels),
+        "status": "dispatched",
+    }
 
-            for user in users:
-                if user.target_channel:
-                    try:
-                        await _generate_digest_for_user(
-                            user.telegram_id,
-                            user.target_channel,
-                        )
-                    except Exception as e:
-                        logger.exception(f"Error for user {user.telegram_id}: {e}")
 
-            return len(users)
+@app.task(name="lib.worker.tasks.prune_posts_task")
+def prune_posts_task() -> dict:
+    """
+    Celery task: Drop daily partitions of stored posts past retention.
+    Called by Celery Beat once a day.
+    """
+    async def _prune():
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=settings.posts_retention_days)).date()
+
+        async with async_session_maker() as session:
+            repo = PostRepository(session)
+            dropped = await repo.drop_partitions_before(cutoff)
+
+        logger.info(f"Dropped {dropped} post partitions older than {cutoff}")
+        return dropped
 
     loop = asyncio.get_event_loop()
-    count = loop.run_until_complete(_run_for_scheduled_users())
-    return {"processed_users": count, "status": "completed"}
+    dropped = loop.run_until_complete(_prune())
+    return {"dropped_partitions": dropped, "status": "completed"}
@@ -0,0 +1,52 @@
+-- Scraped channel posts, partitioned by day of posted_at
+CREATE TABLE IF NOT EXISTS posts (
+    channel VARCHAR(255) NOT NULL,
+    message_id BIGINT NOT NULL,
+    text TEXT NOT NULL,
+    link VARCHAR(512) NOT NULL,
+    posted_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (channel, message_id, posted_at)
+) PARTITION BY RANGE (posted_at);
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS idx_posts_channel_posted_at ON posts(channel, posted_at DESC);
+
+-- Function for creating the daily partition that holds `day`
+CREATE OR REPLACE FUNCTION create_posts_partition(day DATE)
+RETURNS VOID AS $$
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF posts FOR VALUES FROM (%L) TO (%L)',
+        'posts_p' || to_char(day, 'YYYYMMDD'),
+        day::timestamp AT TIME ZONE 'UTC',
+        (day + 1)::timestamp AT TIME ZONE 'UTC'
+    );
+EXCEPTION
+    -- Another worker created it concurrently
+    WHEN duplicate_table THEN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Function for dropping whole daily partitions older than `cutoff`
+CREATE OR REPLACE FUNCTION drop_posts_partitions_before(cutoff DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'posts'
+          AND c.relname ~ '^posts_p[0-9]{8}$'
+          AND to_date(substring(c.relname from 8), 'YYYYMMDD') < cutoff
+    LOOP
+        EXECUTE format('DROP TABLE IF EXISTS %I', part.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ language 'plpgsql';
@@ -0,0 +1,3 @@
+-- Album and forward metadata used to coalesce posts before summarization
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS media_group_id VARCHAR(64);
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS forward_key VARCHAR(128);
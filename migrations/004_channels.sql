@@ -0,0 +1,31 @@
+-- Normalized channels and user subscriptions (replaces users.target_channel)
+CREATE TABLE IF NOT EXISTS channels (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(255) NOT NULL UNIQUE,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS user_channels (
+    user_id BIGINT NOT NULL REFERENCES users(telegram_id) ON DELETE CASCADE,
+    channel_id INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, channel_id)
+);
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS idx_user_channels_channel_id ON user_channels(channel_id);
+
+-- Move existing single-channel settings into subscriptions
+INSERT INTO channels (username)
+SELECT DISTINCT lower(ltrim(target_channel, '@'))
+FROM users
+WHERE target_channel IS NOT NULL
+ON CONFLICT (username) DO NOTHING;
+
+INSERT INTO user_channels (user_id, channel_id)
+SELECT u.telegram_id, c.id
+FROM users u
+JOIN channels c ON c.username = lower(ltrim(u.target_channel, '@'))
+ON CONFLICT DO NOTHING;
+
+ALTER TABLE users DROP COLUMN IF EXISTS target_channel;
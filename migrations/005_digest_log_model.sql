@@ -0,0 +1,2 @@
+-- Model that actually served each digest (primary or a fallback)
+ALTER TABLE digest_logs ADD COLUMN IF NOT EXISTS model VARCHAR(255);
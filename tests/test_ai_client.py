@@ -0,0 +1,103 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+
+from lib.core.config import settings
+from lib.worker import ai_client, cache, singleflight
+from lib.worker.scraper import Post
+
+
+class FakeRedis:
+    """The few Redis commands used by the digest cache and single-flight."""
+
+    def __init__(self):
+        self.data: dict[str, object] = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def eval(self, script, numkeys, key, token):
+        # Only the lock release script is used here
+        if self.data.get(key) == token:
+            del self.data[key]
+            return 1
+        return 0
+
+    async def hincrby(self, key, field, amount):
+        counters = self.data.setdefault(key, {})
+        counters[field] = counters.get(field, 0) + amount
+        return counters[field]
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.slots = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        self.slots += 1
+        yield
+
+
+class StarvedLimiter:
+    """The shared limiter during a top-of-hour fan-out: no slot to be had."""
+
+    @asynccontextmanager
+    async def slot(self):
+        raise TimeoutError("No LLM slot available")
+        yield
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(singleflight, "get_redis", lambda: fake)
+    monkeypatch.setattr(cache, "get_redis", lambda: fake)
+    monkeypatch.setattr(singleflight, "POLL_INTERVAL", 0.01)
+    return fake
+
+
+def _posts() -> list[Post]:
+    return [
+        Post(id=1, text="Центробанк сохранил ключевую ставку", link="https://t.me/news/1", date=datetime(2026, 1, 1)),
+        Post(id=2, text="Нефть подорожала на фоне новостей", link="https://t.me/news/2", date=datetime(2026, 1, 1)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_interactive_digest_does_not_wait_for_bulk_leader(redis, monkeypatch):
+    posts = _posts()
+    interactive_limiter = RecordingLimiter()
+
+    async def complete(client, model, messages):
+        return "<b>Ставка</b>\nЦентробанк сохранил ставку.", 42
+
+    monkeypatch.setattr(ai_client, "INTERACTIVE_WAIT_TIMEOUT", 0.05)
+    monkeypatch.setattr(ai_client, "llm_limiter", StarvedLimiter())
+    monkeypatch.setattr(ai_client, "interactive_llm_limiter", interactive_limiter)
+    monkeypatch.setattr(ai_client, "get_openrouter_client", lambda: None)
+    monkeypatch.setattr(ai_client, "_complete", complete)
+
+    # A scheduled prepare of the same posts holds the generation lock while
+    # it queues for a shared limiter slot
+    cache_key = ai_client.digest_cache.key("news", settings.openrouter_model, posts)
+    await redis.set(f"{cache_key}:lock", "bulk-leader")
+
+    text, tokens_used, model = await ai_client.generate_digest(
+        posts, "news", interactive=True, timeout=5.0
+    )
+
+    assert "Центробанк" in text
+    assert tokens_used == 42
+    assert model == settings.openrouter_model
+    assert interactive_limiter.slots == 1
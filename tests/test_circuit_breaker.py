@@ -0,0 +1,86 @@
+from contextlib import asynccontextmanager
+
+import pytest
+
+from lib.worker.circuit_breaker import CircuitBreaker
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    # No cooldown: an opened breaker is half-open right away
+    breaker = CircuitBreaker("model", failure_threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("model", failure_threshold=2, cooldown=60.0)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = _half_open_breaker()
+
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_trial_closes():
+    breaker = _half_open_breaker()
+    breaker.allow()
+
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker("model", failure_threshold=1, cooldown=60.0)
+    breaker.record_failure()
+    breaker._opened_at -= 60.0
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+def test_released_trial_lets_next_call_through():
+    breaker = _half_open_breaker()
+    breaker.allow()
+
+    breaker.release_trial()
+
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+
+class _StarvedLimiter:
+    """Limiter that never hands out a slot."""
+
+    @asynccontextmanager
+    async def slot(self):
+        raise TimeoutError("No LLM slot available")
+        yield
+
+
+@pytest.mark.asyncio
+async def test_trial_without_slot_is_given_back(monkeypatch):
+    from lib.worker import ai_client
+
+    breaker = _half_open_breaker()
+    monkeypatch.setattr(ai_client, "get_breaker", lambda *args: breaker)
+    monkeypatch.setattr(ai_client, "llm_limiter", _StarvedLimiter())
+
+    with pytest.raises(TimeoutError):
+        await ai_client._generate_with_model(None, "model", [], None)
+
+    assert breaker.state == "half-open"
+    assert breaker.allow()